@@ -54,6 +54,10 @@ async def oauth2_callback(request: Request):
 
     try:
         flow.fetch_token(code=code)
+        
+        # Logged in: move the session to a fresh id so one issued before login can't be reused
+        request.session.regenerate()
+        request.session.pop("state", None)
 
         # Store credentials in the session
         credentials = flow.credentials
@@ -63,7 +67,8 @@ async def oauth2_callback(request: Request):
             "token_uri": credentials.token_uri,
             "client_id": credentials.client_id,
             "client_secret": credentials.client_secret,
-            "scopes": credentials.scopes
+            "scopes": credentials.scopes,
+            "expiry": credentials.expiry.isoformat() if credentials.expiry else None
         }
         
         # Return HTML that closes the popup and reloads the parent window
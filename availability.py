@@ -0,0 +1,100 @@
+# availability.py
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import compress, tee
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp into epoch seconds, assuming UTC when no offset is given"""
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+class BusyIndex:
+    """Sorted, non-overlapping busy intervals stored as parallel epoch-second arrays"""
+
+    def __init__(self):
+        self.starts = array('d')
+        self.ends = array('d')
+
+    @classmethod
+    def from_periods(cls, busy_periods):
+        """Parse busy periods ({'start', 'end'} ISO strings) once and merge them"""
+        intervals = []
+        for busy in busy_periods:
+            start = parse_timestamp(busy['start'])
+            end = parse_timestamp(busy['end'])
+            if end > start:
+                intervals.append((start, end))
+        return cls.from_intervals(intervals)
+
+    @classmethod
+    def from_intervals(cls, intervals):
+        """Build an index from (start, end) epoch pairs in any order"""
+        return cls.from_sorted_intervals(sorted(intervals))
+
+    @classmethod
+    def from_sorted_intervals(cls, intervals):
+        """Build an index from (start, end) epoch pairs already ordered by start, without re-sorting"""
+        index = cls()
+        for start, end in intervals:
+            # Merge periods that overlap or touch the previous one
+            if index.ends and start <= index.ends[-1]:
+                if end > index.ends[-1]:
+                    index.ends[-1] = end
+            else:
+                index.starts.append(start)
+                index.ends.append(end)
+        return index
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end):
+        """Insert a busy interval in place, merging it with any it overlaps or touches"""
+        lo = bisect_left(self.ends, start)
+        hi = bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = array('d', [start])
+        self.ends[lo:hi] = array('d', [end])
+
+    def free_windows(self, start, end):
+        """Gaps between busy intervals within [start, end) as (start, end) epoch pairs"""
+        windows = []
+        cursor = start
+        i = max(bisect_right(self.starts, start) - 1, 0)
+        for busy_start, busy_end in zip(self.starts[i:], self.ends[i:]):
+            if busy_start >= end:
+                break
+            if busy_start > cursor:
+                windows.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        if cursor < end:
+            windows.append((cursor, end))
+        return windows
+
+    def free_mask(self, slot_ranges):
+        """Lazily flag which (start, end) epoch ranges, ascending by start, are free.
+
+        Busy intervals are merged so their ends are sorted too, which lets a single
+        pointer sweep both sequences in one linear pass.
+        """
+        starts, ends = self.starts, self.ends
+        count = len(starts)
+        j = 0
+        for slot_start, slot_end in slot_ranges:
+            # Skip busy intervals that finish before this slot begins
+            while j < count and ends[j] <= slot_start:
+                j += 1
+            yield j == count or starts[j] >= slot_end
+
+def filter_available(candidates, busy_index):
+    """Lazily yield the candidate Slots (ascending) that don't conflict with busy_index.
+
+    candidates may be a generator; slots are only produced as they are consumed.
+    """
+    candidates, ranges = tee(candidates)
+    return compress(candidates, busy_index.free_mask((slot.start, slot.end) for slot in ranges))
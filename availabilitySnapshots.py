@@ -0,0 +1,59 @@
+# availabilitySnapshots.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from availability import BusyIndex
+
+# Oldest snapshot still served while Google Calendar is unavailable (seconds)
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", str(24 * 60 * 60)))
+
+# Users whose last good availability is kept in memory
+SNAPSHOT_MAX_USERS = int(os.getenv("SNAPSHOT_MAX_USERS", "1000"))
+
+class AvailabilitySnapshot(NamedTuple):
+    """Last availability fetched successfully for a user"""
+    fetched_at: float
+    start: float
+    end: float
+    busy_index: BusyIndex
+    event_count: int
+    event_patterns: str
+
+class AvailabilitySnapshots:
+    """Per-user last-known-good availability, served when Google Calendar can't be reached"""
+
+    def __init__(self, max_age=SNAPSHOT_MAX_AGE, max_users=SNAPSHOT_MAX_USERS):
+        self.max_age = max_age
+        self.max_users = max_users
+        self.served = 0
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, user_key, start, end, busy_index, event_count, event_patterns):
+        """Record a successful fetch of [start, end) epoch seconds"""
+        with self._lock:
+            self._snapshots[user_key] = AvailabilitySnapshot(
+                time.time(), start, end, busy_index, event_count, event_patterns
+            )
+            self._snapshots.move_to_end(user_key)
+            while len(self._snapshots) > self.max_users:
+                self._snapshots.popitem(last=False)
+
+    def get(self, user_key, start, end):
+        """The user's snapshot if it is recent enough and overlaps [start, end), else None"""
+        with self._lock:
+            snapshot = self._snapshots.get(user_key)
+            if snapshot is None or time.time() - snapshot.fetched_at > self.max_age:
+                return None
+            if snapshot.end <= start or end <= snapshot.start:
+                return None
+            self.served += 1
+            return snapshot
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._snapshots), "served": self.served}
+
+availability_snapshots = AvailabilitySnapshots()
@@ -0,0 +1,100 @@
+"""Benchmark the local command parser fast path against the LLM path.
+
+Replays the labeled corpus in command_corpus.jsonl with a fixed clock and
+reports how many commands the local parser answers confidently (fast-path
+hit rate), how accurate those answers are, and the latency of each path.
+The LLM path is only timed when OPENAI_API_KEY is set (OPENAI_BASE_URL can
+point it at a local stub server).
+
+Usage: python benchmarks/bench_command_parser.py
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from commandParser import parse_command, is_confident
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_corpus.jsonl")
+
+# Thursday; relative dates in the corpus labels are resolved against this
+NOW = datetime(2025, 4, 10, 8, 0)
+
+REPEATS = 200
+
+def load_corpus():
+    with open(CORPUS_PATH) as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+def parsed_matches_label(parsed, item):
+    """Whether the parsed date and time agree with the labels"""
+    date = parsed['event_date']
+    parsed_date = f"{date['year']:04d}-{date['month']:02d}-{date['day']:02d}" if date else None
+    event_time = parsed['event_time']
+    parsed_time = f"{event_time['hour']:02d}:{event_time['minute']:02d}" if event_time else None
+    return parsed_date == item['date'] and (item['time'] is None or parsed_time == item['time'])
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def bench_local(corpus):
+    latencies = []
+    confident = []
+    for item in corpus:
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            parsed = parse_command(item["command"], clock=lambda: NOW)
+        latencies.append((time.perf_counter() - start) / REPEATS * 1e6)
+        if is_confident(parsed):
+            confident.append((item, parsed))
+
+    correct = sum(parsed_matches_label(parsed, item) for item, parsed in confident)
+    print("Local parser")
+    print(f"  commands:           {len(corpus)}")
+    print(f"  fast-path hit rate: {len(confident) / len(corpus):.0%} ({len(confident)}/{len(corpus)})")
+    if confident:
+        print(f"  fast-path accuracy: {correct / len(confident):.0%} ({correct}/{len(confident)})")
+    print(f"  latency (us):       mean {statistics.mean(latencies):.1f}  "
+          f"p50 {percentile(latencies, 0.5):.1f}  p95 {percentile(latencies, 0.95):.1f}")
+    return [item for item in corpus if not any(item is hit for hit, _ in confident)]
+
+def bench_llm(commands):
+    print("LLM path")
+    print(f"  commands routed:    {len(commands)}")
+    if not os.getenv("OPENAI_API_KEY"):
+        print("  skipped (OPENAI_API_KEY not set)")
+        return
+
+    from availability import BusyIndex
+    from main import generate_available_slots, process_with_openai
+    from slots import SlotGrid
+
+    slots = generate_available_slots(datetime.now(timezone.utc), 14, BusyIndex(), SlotGrid())[:20]
+    slots_str = "\n".join(f"{slot.isoformat()} - {slot.isoformat()}" for slot in slots)
+
+    async def run():
+        latencies = []
+        found = 0
+        for item in commands:
+            start = time.perf_counter()
+            result = await process_with_openai(item['command'], slots_str)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found += bool(result and result.get("found_slot"))
+        return latencies, found
+
+    latencies, found = asyncio.run(run())
+    if latencies:
+        print(f"  found a slot:       {found}/{len(commands)}")
+        print(f"  latency (ms):       mean {statistics.mean(latencies):.1f}  "
+              f"p50 {percentile(latencies, 0.5):.1f}  p95 {percentile(latencies, 0.95):.1f}")
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    routed_to_llm = bench_local(corpus)
+    bench_llm(routed_to_llm)
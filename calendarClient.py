@@ -0,0 +1,272 @@
+# calendarClient.py
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+import httplib2
+from google.auth.exceptions import RefreshError, TransportError
+from googleapiclient.errors import HttpError
+from googleCalendar import (
+    get_busy_index, create_calendar_event, get_calendar_event, credentials_key,
+    iter_calendar_events, EVENT_PATTERN_FIELDS, query_busy_lists, merge_busy_lists,
+    create_calendar_events, CALENDAR_BATCH_LIMIT, get_calendar_ids
+)
+from availability import parse_timestamp
+from freebusyCache import freebusy_cache
+from eventStore import CALENDAR_SYNC_MODE, get_synced_events
+from scheduler import analyze_event_patterns
+from circuitBreaker import CircuitBreaker, CircuitOpenError
+from availabilitySnapshots import availability_snapshots
+from metrics import span, bind_context
+
+# Maximum number of Google Calendar calls running at the same time
+CALENDAR_MAX_CONCURRENCY = int(os.getenv("CALENDAR_MAX_CONCURRENCY", "16"))
+
+# Seconds to wait for a single Google Calendar call before giving up
+CALENDAR_CALL_TIMEOUT = float(os.getenv("CALENDAR_CALL_TIMEOUT", "10"))
+
+# Background attempts to replace a stale availability snapshot after an outage
+SNAPSHOT_REFRESH_ATTEMPTS = int(os.getenv("SNAPSHOT_REFRESH_ATTEMPTS", "5"))
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# HTTP statuses that mean Google itself is failing or throttling us
+UPSTREAM_FAILURE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# The Google client library is blocking, so calls run on a bounded pool of
+# worker threads and the event loop stays free for other requests
+_executor = ThreadPoolExecutor(max_workers=CALENDAR_MAX_CONCURRENCY, thread_name_prefix="calendar")
+
+# Shared by every Google call, so an outage stops all of them from piling up
+calendar_breaker = CircuitBreaker("Google Calendar")
+
+# User key -> running snapshot refresh task
+_snapshot_refreshes = {}
+
+def _is_upstream_failure(error):
+    """Whether an error means Google is down or throttling, rather than a bad request"""
+    if isinstance(error, HttpError):
+        return error.resp.status in UPSTREAM_FAILURE_STATUS_CODES
+    # Timeouts and connection errors
+    return isinstance(error, (TimeoutError, OSError, httplib2.HttpLib2Error, TransportError))
+
+def is_outage(error):
+    """Whether an error means Google is unavailable right now (open circuit, timeout, 429 or 5xx)"""
+    return isinstance(error, CircuitOpenError) or _is_upstream_failure(error)
+
+def is_auth_failure(error):
+    """Whether an error means the user's Google access was revoked or denied"""
+    if isinstance(error, HttpError):
+        return error.resp.status in (401, 403)
+    return isinstance(error, RefreshError)
+
+async def run_blocking_call(func, *args, timeout=None):
+    """Run a blocking function on the worker pool and await its result, outside calendar_breaker.
+
+    For Google calls that aren't Calendar API calls, such as OAuth token refreshes.
+    """
+    timeout = timeout or CALENDAR_CALL_TIMEOUT
+    loop = asyncio.get_running_loop()
+    # Spans recorded on the worker thread still belong to the calling request
+    future = loop.run_in_executor(_executor, bind_context(partial(func, *args)))
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        # The worker thread can't be interrupted; it finishes in the background
+        # and its result is discarded
+        raise TimeoutError(f"Google call {func.__name__} timed out after {timeout}s")
+
+async def run_calendar_call(func, *args, timeout=None):
+    """Run a blocking googleCalendar function on the worker pool and await its result.
+
+    Raises CircuitOpenError without calling Google while calendar_breaker is open.
+    """
+    calendar_breaker.before_call()
+    try:
+        result = await run_blocking_call(func, *args, timeout=timeout)
+    except asyncio.CancelledError:
+        # Abandoned by the caller (e.g. a sibling call in a gather failed); says nothing about Google
+        calendar_breaker.record_abandoned()
+        raise
+    except Exception as e:
+        # Timeouts count as upstream failures
+        if _is_upstream_failure(e):
+            calendar_breaker.record_failure()
+        else:
+            calendar_breaker.record_success()
+        raise
+    calendar_breaker.record_success()
+    return result
+
+async def fetch_freebusy(credentials, time_min, time_max, timeout=None):
+    """Async version of get_busy_index"""
+    return await run_calendar_call(get_busy_index, credentials, time_min, time_max, timeout=timeout)
+
+def _event_patterns(credentials, time_min, time_max):
+    """Analyze event patterns while streaming events page by page"""
+    if CALENDAR_SYNC_MODE == "incremental":
+        events = get_synced_events(credentials, time_min, time_max)
+    else:
+        events = iter_calendar_events(credentials, time_min, time_max, fields=EVENT_PATTERN_FIELDS)
+    # In full mode events stream in while they're analyzed, so this includes page fetches
+    with span("analyze_event_patterns"):
+        return analyze_event_patterns(events)
+
+async def fetch_event_patterns(credentials, time_min, time_max, timeout=None):
+    """Event count and pattern summary for the range; the analysis runs on the worker pool"""
+    with span("events"):
+        return await run_calendar_call(_event_patterns, credentials, time_min, time_max, timeout=timeout)
+
+async def fetch_busy_index(credentials, time_min, time_max, timeout=None):
+    """Merged busy periods for the range, served from the per-user cache when possible"""
+    user_key = credentials_key(credentials)
+    start = parse_timestamp(time_min)
+    end = parse_timestamp(time_max)
+
+    busy_index = freebusy_cache.get(user_key, start, end)
+    if busy_index is None:
+        # Fetch whole UTC days so later queries for sub-ranges hit the cache
+        window_start = start - start % SECONDS_PER_DAY
+        window_end = end if end % SECONDS_PER_DAY == 0 else end - end % SECONDS_PER_DAY + SECONDS_PER_DAY
+        with span("freebusy"):
+            busy_index = await fetch_freebusy(
+                credentials,
+                datetime.fromtimestamp(window_start, timezone.utc).isoformat(),
+                datetime.fromtimestamp(window_end, timezone.utc).isoformat(),
+                timeout=timeout,
+            )
+        freebusy_cache.put(user_key, window_start, window_end, busy_index)
+    return busy_index
+
+def _group_busy_index(credentials, calendar_ids, time_min, time_max, include_self):
+    """Union of everyone's busy periods, so its gaps are the times all readable attendees are free"""
+    if include_self:
+        # The same calendars the user's own availability is built from
+        calendar_ids = list(dict.fromkeys(get_calendar_ids(credentials) + calendar_ids))
+    busy_by_calendar, errors_by_calendar = query_busy_lists(credentials, time_min, time_max, calendar_ids)
+    return merge_busy_lists(busy_by_calendar.values()), errors_by_calendar
+
+async def fetch_group_busy_index(credentials, calendar_ids, time_min, time_max, include_self=False, timeout=None):
+    """Merged busy periods of several attendees' calendars (emails or calendar IDs).
+
+    With include_self every calendar in the user's list is added. Returns
+    (busy_index, errors_by_calendar) for calendars Google couldn't read.
+    """
+    return await run_calendar_call(
+        _group_busy_index, credentials, calendar_ids, time_min, time_max, include_self, timeout=timeout
+    )
+
+async def insert_event(credentials, event_data, timeout=None):
+    """Async version of create_calendar_event that also marks the new event busy in the cache"""
+    event = await run_calendar_call(create_calendar_event, credentials, event_data, timeout=timeout)
+    freebusy_cache.add_busy(
+        credentials_key(credentials),
+        parse_timestamp(event_data["start"]["dateTime"]),
+        parse_timestamp(event_data["end"]["dateTime"]),
+    )
+    return event
+
+async def fetch_event(credentials, event_id, timeout=None):
+    """Async version of get_calendar_event"""
+    return await run_calendar_call(get_calendar_event, credentials, event_id, timeout=timeout)
+
+async def insert_events(credentials, events_data, timeout=None):
+    """Async version of create_calendar_events; invalidates the user's cached availability once.
+
+    Each batch request is its own call with its own timeout, so a failed or timed
+    out batch marks only its events as errors and earlier results are kept.
+    """
+    results = []
+    try:
+        for offset in range(0, len(events_data), CALENDAR_BATCH_LIMIT):
+            chunk = events_data[offset:offset + CALENDAR_BATCH_LIMIT]
+            try:
+                results.extend(await run_calendar_call(create_calendar_events, credentials, chunk, timeout=timeout))
+            except Exception as e:
+                results.extend((None, e) for _ in chunk)
+        return results
+    finally:
+        # Even a failed batch may have created some events
+        freebusy_cache.invalidate(credentials_key(credentials))
+
+async def _timed(name, coro, timings):
+    """Await coro and record how long it took in milliseconds"""
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+async def fetch_schedule_data(credentials, time_min, time_max, timeout=None):
+    """Fetch busy periods and analyze events for the same range concurrently.
+
+    Returns (busy_index, (event_count, patterns), timings) where timings holds per-call and
+    total milliseconds. If the whole fan-out exceeds timeout, both calls are
+    cancelled and TimeoutError is raised.
+    """
+    timeout = timeout or CALENDAR_CALL_TIMEOUT
+    timings = {}
+    start = time.perf_counter()
+    fan_out = asyncio.gather(
+        _timed("freebusy_ms", fetch_busy_index(credentials, time_min, time_max, timeout=timeout), timings),
+        _timed("events_ms", fetch_event_patterns(credentials, time_min, time_max, timeout=timeout), timings),
+    )
+    try:
+        busy_index, event_patterns = await asyncio.wait_for(fan_out, timeout)
+    except asyncio.TimeoutError:
+        # Its timer starts first, so this fires before the per-call timeouts and the
+        # cancelled calls are only counted as abandoned; the hang is a failure
+        calendar_breaker.record_failure()
+        raise TimeoutError(f"Fetching schedule data timed out after {timeout}s")
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    availability_snapshots.put(
+        credentials_key(credentials), parse_timestamp(time_min), parse_timestamp(time_max),
+        busy_index, *event_patterns
+    )
+    return busy_index, event_patterns, timings
+
+async def fetch_schedule_data_or_snapshot(credentials, time_min, time_max, timeout=None):
+    """fetch_schedule_data, falling back to the user's last good snapshot when it fails.
+
+    Returns (busy_index, (event_count, patterns), timings, snapshot); snapshot is
+    None for fresh data. Only outages (an open circuit, timeouts, 429s and 5xx) fall
+    back; errors such as revoked access are raised. Serving a snapshot starts a
+    background refresh. Without a usable snapshot the original error is raised.
+    """
+    try:
+        busy_index, event_patterns, timings = await fetch_schedule_data(credentials, time_min, time_max, timeout)
+        return busy_index, event_patterns, timings, None
+    except Exception as e:
+        if not is_outage(e):
+            raise
+        snapshot = availability_snapshots.get(
+            credentials_key(credentials), parse_timestamp(time_min), parse_timestamp(time_max)
+        )
+        if snapshot is None:
+            raise
+    refresh_snapshot_in_background(credentials, time_min, time_max)
+    return snapshot.busy_index, (snapshot.event_count, snapshot.event_patterns), {}, snapshot
+
+def refresh_snapshot_in_background(credentials, time_min, time_max):
+    """Re-fetch the user's availability once the circuit breaker lets calls through again"""
+    user_key = credentials_key(credentials)
+    if user_key in _snapshot_refreshes:
+        return
+    task = asyncio.create_task(_refresh_snapshot(credentials, time_min, time_max))
+    _snapshot_refreshes[user_key] = task
+    task.add_done_callback(lambda _: _snapshot_refreshes.pop(user_key, None))
+
+async def _refresh_snapshot(credentials, time_min, time_max):
+    for _ in range(SNAPSHOT_REFRESH_ATTEMPTS):
+        # Wait until the breaker allows a trial call (at least a second between attempts)
+        await asyncio.sleep(max(calendar_breaker.retry_after(), 1.0))
+        try:
+            # A successful fetch records a fresh snapshot
+            await fetch_schedule_data(credentials, time_min, time_max)
+            return
+        except Exception as e:
+            # Anything but an outage won't go away by retrying
+            if not is_outage(e):
+                return
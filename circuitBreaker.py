@@ -0,0 +1,85 @@
+# circuitBreaker.py
+import os
+import threading
+import time
+
+# Consecutive upstream failures that open the circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+
+# Seconds the circuit stays open before a trial call is let through
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is known to be failing"""
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures and probes it again later.
+
+    closed: calls go through and consecutive failures are counted.
+    open: calls fail fast with CircuitOpenError until reset_timeout passes.
+    half_open: one trial call goes through; success closes the circuit and
+    failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} is unavailable; retrying in {self.retry_after():.0f}s")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} is unavailable; a trial call is in progress")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """A call given up before it finished: frees the trial slot without judging the upstream"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def retry_after(self):
+        """Seconds until an open circuit lets a trial call through (0 when not open)"""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def stats(self):
+        """Current state and counters"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
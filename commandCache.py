@@ -0,0 +1,136 @@
+# commandCache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# "memory" or "sqlite"
+COMMAND_CACHE_BACKEND = os.getenv("COMMAND_CACHE_BACKEND", "memory")
+
+# SQLite file used by the sqlite backend
+COMMAND_CACHE_PATH = os.getenv("COMMAND_CACHE_PATH", "./command_cache.sqlite3")
+
+# Seconds a cached parse stays valid
+COMMAND_CACHE_TTL = float(os.getenv("COMMAND_CACHE_TTL", "3600"))
+
+# Entries kept before the least recently used ones are evicted
+COMMAND_CACHE_MAX_ENTRIES = int(os.getenv("COMMAND_CACHE_MAX_ENTRIES", "5000"))
+
+_WHITESPACE = re.compile(r'\s+')
+_EDGE_PUNCTUATION = re.compile(r'^[\s.,!?;:"\']+|[\s.,!?;:"\']+$')
+
+def normalize_command(command):
+    """Lowercase, collapse whitespace and strip surrounding punctuation"""
+    return _EDGE_PUNCTUATION.sub('', _WHITESPACE.sub(' ', command.lower()))
+
+def slots_fingerprint(slots):
+    """Short hash identifying the candidate slot list shown to the model"""
+    return hashlib.sha256("\n".join(slots).encode()).hexdigest()[:16]
+
+class MemoryCacheBackend:
+    """In-process LRU with TTL; values are stored as JSON text"""
+
+    def __init__(self, ttl=COMMAND_CACHE_TTL, max_entries=COMMAND_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SqliteCacheBackend:
+    """LRU with TTL persisted to a local SQLite file, shared across restarts and workers"""
+
+    def __init__(self, path=COMMAND_CACHE_PATH, ttl=COMMAND_CACHE_TTL, max_entries=COMMAND_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS command_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS command_cache_last_used ON command_cache (last_used)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM command_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM command_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE command_cache SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO command_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now)
+            )
+            # Drop expired rows, then the least recently used beyond the cap
+            self._conn.execute("DELETE FROM command_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM command_cache WHERE key IN ("
+                "SELECT key FROM command_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+class CommandCache:
+    """Caches model parses of scheduling commands by normalized command and slot list"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, command, slots):
+        return f"{slots_fingerprint(slots)}:{normalize_command(command)}"
+
+    def get(self, command, slots):
+        """Cached parse as a fresh dict, or None"""
+        value = self.backend.get(self._key(command, slots))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, command, slots, parsed_result):
+        self.backend.set(self._key(command, slots), json.dumps(parsed_result))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+def create_command_cache():
+    """CommandCache using the backend selected by COMMAND_CACHE_BACKEND"""
+    if COMMAND_CACHE_BACKEND == "sqlite":
+        return CommandCache(SqliteCacheBackend())
+    return CommandCache(MemoryCacheBackend())
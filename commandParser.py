@@ -0,0 +1,275 @@
+# commandParser.py
+import re
+from datetime import datetime, timedelta
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3,
+    'apr': 4, 'april': 4, 'may': 5, 'jun': 6, 'june': 6, 'jul': 7, 'july': 7,
+    'aug': 8, 'august': 8, 'sep': 9, 'sept': 9, 'september': 9, 'oct': 10, 'october': 10,
+    'nov': 11, 'november': 11, 'dec': 12, 'december': 12
+}
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
+}
+
+# Times of day that only hint at a time rather than name one
+VAGUE_TIMES = {'morning': 9, 'afternoon': 14, 'evening': 18}
+
+RELATIVE_DAYS = {'today': 0, 'tonight': 0, 'tomorrow': 1, 'day after tomorrow': 2}
+
+_WEEKDAY_ALT = '|'.join(WEEKDAYS)
+_MONTH_ALT = '|'.join(sorted(MONTHS, key=len, reverse=True))
+_NUMBER_ALT = r'\d+|' + '|'.join(NUMBER_WORDS)
+
+def _time(prefix):
+    """Clock time with named groups <prefix>_h, <prefix>_m and <prefix>_ap"""
+    return rf'(?P<{prefix}_h>\d{{1,2}})(?::(?P<{prefix}_m>\d{{2}}))?\s*(?P<{prefix}_ap>am|pm)?'
+
+# Every token the parser understands, in priority order for matches starting at
+# the same position. They are combined into one pattern so a command is
+# tokenized in a single left-to-right scan.
+TOKEN_PATTERNS = [
+    ('iso_date', r'\b(?:on\s+)?(?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2})\b'),
+    ('month_day', rf'\b(?:on\s+)?(?P<md_m>{_MONTH_ALT})\.?\s+(?P<md_d>\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(?P<md_y>\d{{4}}))?'),
+    ('day_month', rf'\b(?:on\s+(?:the\s+)?)?(?P<dm_d>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<dm_m>{_MONTH_ALT})\b(?:,?\s+(?P<dm_y>\d{{4}}))?'),
+    ('numeric_date', r'\b(?:on\s+)?(?P<nd_m>\d{1,2})/(?P<nd_d>\d{1,2})(?:/(?P<nd_y>\d{2}|\d{4}))?\b'),
+    ('relative_day', r'\b(?P<rel>day after tomorrow|tomorrow|today|tonight)\b'),
+    ('in_days', rf'\bin\s+(?P<in_n>{_NUMBER_ALT})\s+(?P<in_u>days?|weeks?)\b'),
+    ('weekday', rf'\b(?:(?P<wd_q>on|this|next)\s+)?(?P<wd>{_WEEKDAY_ALT})\b'),
+    ('range', rf'\b(?:from|between)\s+{_time("rs")}\s*(?:-|to|and|until|till)\s*{_time("re")}'),
+    ('dash_range', rf'\b{_time("ds")}\s*-\s*(?P<de_h>\d{{1,2}})(?::(?P<de_m>\d{{2}}))?\s*(?P<de_ap>am|pm)\b'),
+    ('duration', rf'\bfor\s+(?:(?P<dur_half>half an hour)|(?P<dur_n>(?:{_NUMBER_ALT})(?:\.\d+)?)\s*(?P<dur_u>hours?|hrs?|h|minutes?|mins?|m))\b'),
+    ('at_time', rf'\bat\s+{_time("at")}\b'),
+    ('clock', r'\b(?P<ck_h>\d{1,2})(?::(?P<ck_m>\d{2}))?\s*(?P<ck_ap>am|pm)\b|\b(?P<c24_h>\d{1,2}):(?P<c24_m>\d{2})\b'),
+    ('named_time', r'\b(?P<named>noon|midday|midnight)\b'),
+    ('vague_time', r'\b(?P<vague>morning|afternoon|evening)\b'),
+    ('description', r'\b(?:about|regarding|for|to)\s+'),
+    ('verb', r'\b(?:schedule|book|set up|add|create|plan)\s+(?:(?:an?|the|my)\s+)?'),
+]
+# Every token starts a word, so the lookbehind skips the alternation at all
+# other positions
+COMMAND_GRAMMAR = re.compile(
+    r'(?<!\w)(?:' + '|'.join(f'(?P<{kind}>{pattern})' for kind, pattern in TOKEN_PATTERNS) + ')'
+    r'|(?P<punctuation>[,.!?])'
+)
+
+DATE_TOKENS = ['iso_date', 'month_day', 'day_month', 'numeric_date', 'relative_day', 'in_days', 'weekday']
+TIME_TOKENS = ['range', 'dash_range', 'at_time', 'clock', 'named_time', 'vague_time']
+MARKER_TOKENS = ('description', 'verb', 'punctuation')
+
+# Words that end an event name when no token does
+NAME_STOP = re.compile(r'\s(?:on|at|from|between|this|next|in)\s')
+_WHITESPACE = re.compile(r'\s+')
+
+# Confidence contributions; a parse is "confident" at FAST_PATH_CONFIDENCE or above
+# with an exact time
+DATE_CONFIDENCE = 0.4
+EXACT_TIME_CONFIDENCE = 0.4
+AMBIGUOUS_TIME_CONFIDENCE = 0.2
+VAGUE_TIME_CONFIDENCE = 0.1
+NAME_CONFIDENCE = 0.2
+FAST_PATH_CONFIDENCE = 0.8
+
+def _number(text):
+    return NUMBER_WORDS[text] if text in NUMBER_WORDS else float(text)
+
+def _to_24_hour(hour, am_pm):
+    """Convert to 24-hour format; ambiguous early hours (e.g. "at 5") are taken as PM"""
+    if am_pm:
+        if am_pm == 'pm' and hour < 12:
+            hour += 12
+        elif am_pm == 'am' and hour == 12:
+            hour = 0
+    elif hour < 8:
+        hour += 12
+    return hour
+
+def _explicit_date(year, month, day, today):
+    """Date for an explicit day/month, rolling to next year if it already passed"""
+    try:
+        if year:
+            year = int(year)
+            return datetime(year + 2000 if year < 100 else year, month, day)
+        target = datetime(today.year, month, day)
+        if target.date() < today.date():
+            target = datetime(today.year + 1, month, day)
+        return target
+    except ValueError:
+        return None
+
+def _resolve_date(kind, match, today, command):
+    """Target datetime for a date token, or None if it isn't a valid date"""
+    group = match.group
+    if kind == 'iso_date':
+        return _explicit_date(group('iso_y'), int(group('iso_m')), int(group('iso_d')), today)
+    if kind == 'month_day':
+        return _explicit_date(group('md_y'), MONTHS[group('md_m')], int(group('md_d')), today)
+    if kind == 'day_month':
+        return _explicit_date(group('dm_y'), MONTHS[group('dm_m')], int(group('dm_d')), today)
+    if kind == 'numeric_date':
+        return _explicit_date(group('nd_y'), int(group('nd_m')), int(group('nd_d')), today)
+    if kind == 'relative_day':
+        return today + timedelta(days=RELATIVE_DAYS[group('rel')])
+    if kind == 'in_days':
+        days = int(_number(group('in_n'))) * (7 if group('in_u').startswith('week') else 1)
+        try:
+            return today + timedelta(days=days)
+        except OverflowError:
+            # Past datetime's range, e.g. "in 100000000 days"
+            return None
+
+    day_index = WEEKDAYS.index(group('wd'))
+    days_ahead = (day_index - today.weekday()) % 7
+    if group('wd_q') == 'next':
+        # Next week's day
+        days_ahead += 7
+    elif days_ahead == 0 and "today" not in command:
+        # If it's today, assume next week
+        days_ahead = 7
+    return today + timedelta(days=days_ahead)
+
+def _resolve_time(kind, match):
+    """(event_time, end_time, confidence) for a time token, or None if it's out of range (e.g. "25pm", "99:99")"""
+    event_time, end_time, confidence = _read_time(kind, match)
+    for value in (event_time, end_time):
+        if value and (value['hour'] > 23 or value['minute'] > 59):
+            return None
+    return event_time, end_time, confidence
+
+def _read_time(kind, match):
+    """(event_time, end_time, confidence) for a time token, without range checks"""
+    group = match.group
+    if kind in ('range', 'dash_range'):
+        start, end = ('rs', 're') if kind == 'range' else ('ds', 'de')
+        end_ampm = group(f'{end}_ap')
+        # "2-3pm" means both ends are PM
+        start_ampm = group(f'{start}_ap') or end_ampm
+        event_time = {'hour': _to_24_hour(int(group(f'{start}_h')), start_ampm), 'minute': int(group(f'{start}_m') or 0)}
+        end_time = {'hour': _to_24_hour(int(group(f'{end}_h')), end_ampm), 'minute': int(group(f'{end}_m') or 0)}
+        return event_time, end_time, EXACT_TIME_CONFIDENCE if end_ampm else AMBIGUOUS_TIME_CONFIDENCE
+    if kind == 'at_time':
+        hour, minute, am_pm = int(group('at_h')), group('at_m'), group('at_ap')
+        event_time = {'hour': _to_24_hour(hour, am_pm), 'minute': int(minute or 0)}
+        exact = am_pm or minute or hour > 12
+        return event_time, None, EXACT_TIME_CONFIDENCE if exact else AMBIGUOUS_TIME_CONFIDENCE
+    if kind == 'clock':
+        if group('ck_h') is not None:
+            event_time = {'hour': _to_24_hour(int(group('ck_h')), group('ck_ap')), 'minute': int(group('ck_m') or 0)}
+        else:
+            event_time = {'hour': int(group('c24_h')), 'minute': int(group('c24_m'))}
+        return event_time, None, EXACT_TIME_CONFIDENCE
+    if kind == 'named_time':
+        hour = 0 if group('named') == 'midnight' else 12
+        return {'hour': hour, 'minute': 0}, None, EXACT_TIME_CONFIDENCE
+    return {'hour': VAGUE_TIMES[group('vague')], 'minute': 0}, None, VAGUE_TIME_CONFIDENCE
+
+def _resolve_duration(match):
+    """Duration token in minutes"""
+    if match.group('dur_half'):
+        return 30
+    amount = _number(match.group('dur_n'))
+    return int(amount * 60 if match.group('dur_u').startswith('h') else amount)
+
+def _free_text(command, value_spans, start):
+    """Text from start to the end of the command that isn't covered by a value token"""
+    pieces = []
+    cursor = start
+    for span_start, span_end in value_spans:
+        if span_end <= cursor:
+            continue
+        pieces.append(command[cursor:span_start])
+        cursor = span_end
+    pieces.append(command[cursor:])
+    return _WHITESPACE.sub(' ', ' '.join(pieces)).strip()
+
+def parse_command(command, clock=datetime.now):
+    """Parse a scheduling command into event fields plus a confidence score.
+
+    The command is tokenized with one scan of COMMAND_GRAMMAR; clock is called
+    once to resolve relative dates. Returns a dict with event_name, event_date
+    ({'year', 'month', 'day'}), event_time and end_time ({'hour', 'minute'}),
+    duration_minutes, description, exact_time (whether the time was stated
+    unambiguously) and confidence (0.0-1.0).
+    """
+    command = command.lower().strip()
+
+    # Single scan: first token of each kind, every token start, and the spans
+    # of value tokens (dates, times, durations) that aren't free text
+    first = {}
+    token_starts = []
+    value_spans = []
+    for match in COMMAND_GRAMMAR.finditer(command):
+        kind = match.lastgroup
+        first.setdefault(kind, match)
+        token_starts.append(match.start())
+        if kind not in MARKER_TOKENS:
+            value_spans.append(match.span())
+
+    confidence = 0.0
+    event_date = None
+    date_kind = next((kind for kind in DATE_TOKENS if kind in first), None)
+    if date_kind:
+        target_date = _resolve_date(date_kind, first[date_kind], clock(), command)
+        if target_date:
+            event_date = {'year': target_date.year, 'month': target_date.month, 'day': target_date.day}
+            confidence += DATE_CONFIDENCE
+
+    event_time = end_time = None
+    exact_time = False
+    time_kind = next((kind for kind in TIME_TOKENS if kind in first), None)
+    resolved_time = _resolve_time(time_kind, first[time_kind]) if time_kind else None
+    if resolved_time:
+        event_time, end_time, time_confidence = resolved_time
+        exact_time = time_confidence >= EXACT_TIME_CONFIDENCE
+        confidence += time_confidence
+
+    duration = _resolve_duration(first['duration']) if 'duration' in first else None
+    if duration is None and event_time and end_time:
+        duration = (end_time['hour'] * 60 + end_time['minute']) - (event_time['hour'] * 60 + event_time['minute'])
+        if duration <= 0:
+            duration = None
+
+    # The name runs from the verb to the next token or stop word
+    event_name = None
+    verb = first.get('verb')
+    if verb:
+        name_end = next((start for start in token_starts if start >= verb.end()), len(command))
+        name = command[verb.end():name_end]
+        stop = NAME_STOP.search(name + ' ')
+        event_name = (name[:stop.start()] if stop else name).strip() or None
+        if event_name:
+            confidence += NAME_CONFIDENCE
+
+    # The description is the free text after "about", "regarding", "for" or "to"
+    description = None
+    marker = first.get('description')
+    if marker and (not verb or marker.start() >= verb.end()):
+        description = _free_text(command, value_spans, marker.end()) or None
+
+    return {
+        'event_name': event_name,
+        'event_date': event_date,
+        'event_time': event_time,
+        'end_time': end_time,
+        'duration_minutes': duration,
+        'description': description,
+        'exact_time': exact_time,
+        'confidence': round(min(confidence, 1.0), 2)
+    }
+
+def parse_commands(commands, clock=datetime.now):
+    """Parse a batch of commands (e.g. replayed from logs), yielding one result per command.
+
+    clock is called once per command, so a replay can supply each command's
+    original timestamp.
+    """
+    for command in commands:
+        yield parse_command(command, clock)
+
+def is_confident(parsed):
+    """Whether a parse is certain enough to skip the LLM; a guessed time (e.g. "at 5") never is"""
+    return parsed['exact_time'] and parsed['confidence'] >= FAST_PATH_CONFIDENCE
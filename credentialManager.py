@@ -0,0 +1,167 @@
+# credentialManager.py
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from googleCalendar import build_credentials, credentials_key
+from calendarClient import run_blocking_call
+from singleflight import SingleFlight
+
+# Refresh access tokens this many seconds before they expire
+CREDENTIAL_REFRESH_MARGIN = float(os.getenv("CREDENTIAL_REFRESH_MARGIN", "300"))
+
+# Seconds between background sweeps for tokens that are about to expire
+CREDENTIAL_CHECK_INTERVAL = float(os.getenv("CREDENTIAL_CHECK_INTERVAL", "60"))
+
+# Only users with a request in this many seconds get their tokens refreshed ahead of
+# expiry; others are refreshed on demand when they come back
+CREDENTIAL_ACTIVE_WINDOW = float(os.getenv("CREDENTIAL_ACTIVE_WINDOW", "1800"))
+
+# Users whose live credentials are kept in memory
+CREDENTIAL_CACHE_MAX_USERS = int(os.getenv("CREDENTIAL_CACHE_MAX_USERS", "1000"))
+
+# Shared transport for token refreshes, so they reuse pooled connections
+_auth_request = GoogleAuthRequest()
+
+class ManagedCredentials:
+    """A user's live Credentials and the sessions that hold a copy of its token"""
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.session_ids = set()
+        self.last_used = time.monotonic()
+
+class CredentialManager:
+    """Live Credentials per user, refreshed in the background before they expire while the user is active.
+
+    Concurrent refreshes for the same user are collapsed into one token request,
+    and the new token is written back to every session of that user.
+    """
+
+    def __init__(self, session_store, refresh_margin=CREDENTIAL_REFRESH_MARGIN,
+                 check_interval=CREDENTIAL_CHECK_INTERVAL, active_window=CREDENTIAL_ACTIVE_WINDOW,
+                 max_users=CREDENTIAL_CACHE_MAX_USERS):
+        self.session_store = session_store
+        self.refresh_margin = refresh_margin
+        self.check_interval = check_interval
+        self.active_window = active_window
+        self.max_users = max_users
+        self.refreshed = 0
+        self.refresh_failures = 0
+        # credentials_key -> ManagedCredentials, least recently used first
+        self._entries = OrderedDict()
+        self._refreshes = SingleFlight()
+        self._task = None
+
+    def _expires_within(self, credentials, seconds):
+        if not credentials.refresh_token or credentials.expiry is None:
+            return False
+        # Credentials.expiry is naive UTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - now <= timedelta(seconds=seconds)
+
+    async def get_credentials(self, session_id, session_creds):
+        """The user's live Credentials for a session's credential dict"""
+        key = credentials_key(session_creds)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = ManagedCredentials(build_credentials(session_creds))
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        entry.last_used = time.monotonic()
+        if session_id:
+            entry.session_ids.add(session_id)
+
+        # Already expired (e.g. the user was idle past the sweep): refresh now, once for all callers
+        if self._expires_within(entry.credentials, 0):
+            try:
+                await self.refresh(key)
+            except Exception:
+                # The client library retries the refresh on its next call
+                pass
+        return entry.credentials
+
+    async def refresh(self, key):
+        """Refresh the user's token, joining a refresh that's already running"""
+        await self._refreshes.do(key, self._refresh, key)
+
+    async def _refresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        try:
+            # Token refreshes hit the OAuth endpoint, not the Calendar API, so they
+            # bypass the calendar circuit breaker
+            await run_blocking_call(entry.credentials.refresh, _auth_request)
+        except Exception:
+            self.refresh_failures += 1
+            raise
+        self.refreshed += 1
+        self._write_back(entry)
+
+    def _write_back(self, entry):
+        """Store the new token and expiry in every session of this user"""
+        credentials = entry.credentials
+        for session_id in list(entry.session_ids):
+            data = self.session_store.load(session_id)
+            if not data or not data.get("credentials"):
+                # Logged out or expired
+                entry.session_ids.discard(session_id)
+                continue
+            data["credentials"] = dict(
+                data["credentials"],
+                token=credentials.token,
+                expiry=credentials.expiry.isoformat() if credentials.expiry else None
+            )
+            self.session_store.save(session_id, data)
+
+    def _has_live_session(self, entry):
+        """Forget sessions that logged out or expired; True if any remain"""
+        for session_id in list(entry.session_ids):
+            data = self.session_store.load(session_id)
+            if not data or not data.get("credentials"):
+                entry.session_ids.discard(session_id)
+        return bool(entry.session_ids)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            active_since = time.monotonic() - self.active_window
+            expiring = []
+            for key, entry in list(self._entries.items()):
+                if entry.last_used < active_since:
+                    # Idle users are refreshed on their next request, if their session is still there
+                    if not self._has_live_session(entry):
+                        self._entries.pop(key, None)
+                    continue
+                if self._expires_within(entry.credentials, self.refresh_margin):
+                    expiring.append(key)
+            # Failures are counted; the next sweep or request tries again
+            await asyncio.gather(*(self.refresh(key) for key in expiring), return_exceptions=True)
+
+    def start(self):
+        """Start the background refresh sweep on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        """Cached users, refresh outcomes and how many refreshes were shared"""
+        return {
+            "users": len(self._entries),
+            "refreshed": self.refreshed,
+            "refresh_failures": self.refresh_failures,
+            "refresh_coalesced": self._refreshes.coalesced
+        }
@@ -0,0 +1,191 @@
+# eventQueue.py
+import asyncio
+import hashlib
+import os
+import random
+import time
+import uuid
+from googleapiclient.errors import HttpError
+from calendarClient import insert_event, fetch_event
+from googleCalendar import credentials_key
+
+# Background workers inserting queued events
+EVENT_QUEUE_WORKERS = int(os.getenv("EVENT_QUEUE_WORKERS", "4"))
+
+# Events waiting to be inserted before new submissions are refused
+EVENT_QUEUE_MAX_SIZE = int(os.getenv("EVENT_QUEUE_MAX_SIZE", "1000"))
+
+# Retries after the first attempt for timeouts, 429s and 5xx responses
+EVENT_QUEUE_MAX_RETRIES = int(os.getenv("EVENT_QUEUE_MAX_RETRIES", "3"))
+
+# Seconds a finished job stays available to the status endpoint
+EVENT_JOB_TTL = float(os.getenv("EVENT_JOB_TTL", "3600"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class EventQueueFull(Exception):
+    """Raised when the queue can't take another event"""
+
+def event_id_for(user_key, idempotency_key):
+    """Deterministic Google event id for a user's idempotency key.
+
+    Event ids may use the characters 0-9 and a-v, so a hex digest is valid;
+    re-inserting the same id fails with 409 instead of creating a duplicate.
+    """
+    return hashlib.sha256(f"{user_key}:{idempotency_key}".encode()).hexdigest()
+
+async def live_event(credentials, event_id):
+    """The event stored under event_id, or None if it was deleted (Google never frees a used id)"""
+    try:
+        event = await fetch_event(credentials, event_id)
+    except HttpError as error:
+        if error.resp.status in (404, 410):
+            return None
+        raise
+    return None if event.get("status") == "cancelled" else event
+
+class EventJob:
+    """One queued event insert and its outcome"""
+
+    def __init__(self, job_id, user_key, credentials, event_body):
+        self.job_id = job_id
+        self.user_key = user_key
+        self.credentials = credentials
+        self.event_body = event_body
+        self.status = "queued"
+        self.attempts = 0
+        self.event_id = None
+        self.error = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "event_id": self.event_id,
+            "error": self.error
+        }
+
+class EventQueue:
+    """Write-behind queue for event inserts, drained by a pool of async workers.
+
+    With an idempotency key the job id doubles as the Google event id, so a
+    resubmitted event joins the existing job and a retried insert can't
+    create a second copy. Without one every submission is a new job.
+    """
+
+    def __init__(self, workers=EVENT_QUEUE_WORKERS, max_size=EVENT_QUEUE_MAX_SIZE,
+                 max_retries=EVENT_QUEUE_MAX_RETRIES, job_ttl=EVENT_JOB_TTL,
+                 backoff_base=0.5, backoff_cap=8.0):
+        self.workers = workers
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.job_ttl = job_ttl
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.jobs = {}
+        self._queue = None
+        self._tasks = []
+
+    def submit(self, credentials, event_body, idempotency_key=None):
+        """Queue an event body for insertion and return its job.
+
+        A repeated key returns the existing job unless that job failed.
+        """
+        self._purge_finished()
+        user_key = credentials_key(credentials)
+        if idempotency_key:
+            job_id = event_id_for(user_key, idempotency_key)
+            job = self.jobs.get(job_id)
+            if job is not None and job.status != "failed":
+                return job
+            event_body = dict(event_body, id=job_id)
+        else:
+            # Google never reuses an event id, even after deletion, so ids are
+            # only fixed when the client asks for idempotency
+            job_id = uuid.uuid4().hex
+
+        job = EventJob(job_id, user_key, credentials, event_body)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise EventQueueFull(f"Event queue is full ({self.max_size} events waiting)")
+        self.jobs[job_id] = job
+        return job
+
+    def get_job(self, job_id, credentials):
+        """The caller's job with this id, or None"""
+        job = self.jobs.get(job_id)
+        if job is None or job.user_key != credentials_key(credentials):
+            return None
+        return job
+
+    def _purge_finished(self):
+        cutoff = time.monotonic() - self.job_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    async def _insert(self, job):
+        for attempt in range(self.max_retries + 1):
+            job.attempts += 1
+            try:
+                try:
+                    event = await insert_event(job.credentials, job.event_body)
+                except HttpError as error:
+                    if error.resp.status != 409:
+                        raise
+                    # The id is taken: either an earlier attempt created the event, or
+                    # it belonged to an event that has since been deleted
+                    event = await live_event(job.credentials, job.job_id)
+                    if event is None:
+                        job.error = "Event id belongs to a deleted event; resend with a new Idempotency-Key"
+                        break
+                job.event_id = event.get("id")
+                job.status = "succeeded"
+                job.error = None
+                return
+            except HttpError as error:
+                job.error = str(error)
+                if error.resp.status not in RETRYABLE_STATUS_CODES:
+                    break
+            except Exception as e:
+                job.error = str(e)
+            if attempt < self.max_retries:
+                # Exponential backoff with full jitter
+                await asyncio.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+        job.status = "failed"
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            try:
+                await self._insert(job)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.monotonic()
+                # The job no longer needs the user's credentials
+                job.credentials = None
+                self._queue.task_done()
+
+    def start(self):
+        """Start the worker pool on the running event loop"""
+        if not self._tasks:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        """Queue depth and job counts by status"""
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"queued": self._queue.qsize() if self._queue else 0, "jobs": counts}
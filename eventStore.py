@@ -0,0 +1,127 @@
+# eventStore.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from googleapiclient.errors import HttpError
+from googleCalendar import list_event_changes, credentials_key
+from availability import parse_timestamp
+
+# "incremental" keeps a local event store per user updated with sync tokens,
+# "full" lists the whole window from Google on every request
+CALENDAR_SYNC_MODE = os.getenv("CALENDAR_SYNC_MODE", "full")
+
+# How far back the initial full sync reaches; older events are pruned on every sync
+EVENT_SYNC_LOOKBACK_DAYS = int(os.getenv("EVENT_SYNC_LOOKBACK_DAYS", "30"))
+
+# How far ahead events are stored; later ones (e.g. far-off recurring instances) are
+# dropped, and a query reaching past the stored window starts a fresh full sync
+EVENT_SYNC_HORIZON_DAYS = int(os.getenv("EVENT_SYNC_HORIZON_DAYS", "90"))
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Number of users whose event stores are kept in memory
+EVENT_STORE_MAX_USERS = int(os.getenv("EVENT_STORE_MAX_USERS", "1000"))
+
+def event_start_timestamp(event):
+    """Epoch seconds of an event's start (all-day events start at midnight UTC)"""
+    start = event.get('start', {})
+    value = start.get('dateTime') or start.get('date')
+    return parse_timestamp(value) if value else None
+
+class UserEventStore:
+    """Local copy of one user's primary-calendar events kept current with sync tokens.
+
+    Only events starting between EVENT_SYNC_LOOKBACK_DAYS ago and window_end are
+    kept, so the store stays bounded in a long-running process.
+    """
+
+    def __init__(self):
+        # event id -> (start epoch seconds, event with only the fields we need)
+        self.events = {}
+        self.sync_token = None
+        # Events starting at or after this epoch second are not stored
+        self.window_end = 0
+        self._lock = threading.Lock()
+
+    def sync(self, credentials, time_max=None):
+        """Pull changes since the last sync, falling back to a full sync when needed.
+
+        A full sync also runs when time_max is past the stored window, since
+        events beyond it were dropped and won't come back as changes.
+        """
+        now = time.time()
+        needed_end = parse_timestamp(time_max) if time_max else now
+        with self._lock:
+            if self.sync_token and needed_end <= self.window_end:
+                try:
+                    items, self.sync_token = list_event_changes(credentials, sync_token=self.sync_token)
+                    self._apply(items)
+                    self._prune(now)
+                    return
+                except HttpError as error:
+                    # 410 Gone: the sync token expired, start over with a full sync
+                    if error.resp.status != 410:
+                        raise
+                    self.sync_token = None
+
+            time_min = datetime.fromtimestamp(now - EVENT_SYNC_LOOKBACK_DAYS * SECONDS_PER_DAY, timezone.utc)
+            # Google still returns every future instance; only the window is kept
+            items, self.sync_token = list_event_changes(credentials, time_min=time_min.isoformat())
+            self.events.clear()
+            self.window_end = max(now + EVENT_SYNC_HORIZON_DAYS * SECONDS_PER_DAY, needed_end)
+            self._apply(items)
+            self._prune(now)
+
+    def events_between(self, time_min, time_max):
+        """Stored events starting within [time_min, time_max), ordered by start time"""
+        start = parse_timestamp(time_min)
+        end = parse_timestamp(time_max)
+        with self._lock:
+            in_range = [(ts, event) for ts, event in self.events.values() if start <= ts < end]
+        in_range.sort(key=lambda item: item[0])
+        return [event for _, event in in_range]
+
+    def _apply(self, items):
+        for event in items:
+            if event.get('status') == 'cancelled':
+                self.events.pop(event['id'], None)
+                continue
+            try:
+                start_ts = event_start_timestamp(event)
+            except ValueError:
+                continue
+            if start_ts is None or start_ts >= self.window_end:
+                # Moved (or created) past the window
+                self.events.pop(event['id'], None)
+                continue
+            self.events[event['id']] = (start_ts, {'id': event['id'], 'start': event['start']})
+
+    def _prune(self, now):
+        """Drop events that have fallen behind the lookback window"""
+        cutoff = now - EVENT_SYNC_LOOKBACK_DAYS * SECONDS_PER_DAY
+        for event_id in [event_id for event_id, (start_ts, _) in self.events.items() if start_ts < cutoff]:
+            del self.events[event_id]
+
+_stores = OrderedDict()
+_stores_lock = threading.Lock()
+
+def get_event_store(credentials):
+    """The user's event store, created on first use and evicted least recently used"""
+    key = credentials_key(credentials)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = UserEventStore()
+            if len(_stores) > EVENT_STORE_MAX_USERS:
+                _stores.popitem(last=False)
+        else:
+            _stores.move_to_end(key)
+        return store
+
+def get_synced_events(credentials, time_min, time_max):
+    """Events starting in [time_min, time_max), served from the user's synced local store"""
+    store = get_event_store(credentials)
+    store.sync(credentials, time_max)
+    return store.events_between(time_min, time_max)
@@ -0,0 +1,97 @@
+# freebusyCache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a cached busy window stays fresh
+FREEBUSY_CACHE_TTL = float(os.getenv("FREEBUSY_CACHE_TTL", "60"))
+
+# Upper bound on busy intervals held across all users (each costs 16 bytes)
+FREEBUSY_CACHE_MAX_INTERVALS = int(os.getenv("FREEBUSY_CACHE_MAX_INTERVALS", "200000"))
+
+class FreeBusyCache:
+    """Per-user cache of merged busy intervals (BusyIndex) keyed by the window they cover.
+
+    A lookup is answered by any fresh entry whose window contains the requested
+    range, so narrower queries (e.g. a single day) reuse a wider fetch.
+    """
+
+    def __init__(self, ttl=FREEBUSY_CACHE_TTL, max_intervals=FREEBUSY_CACHE_MAX_INTERVALS):
+        self.ttl = ttl
+        self.max_intervals = max_intervals
+        self.hits = 0
+        self.misses = 0
+        # (user_key, window_start, window_end) -> (expires_at, busy_index), oldest first
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_key, start, end):
+        """Return a BusyIndex covering [start, end) epoch seconds, or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            for key in list(self._by_user.get(user_key, ())):
+                expires_at, busy_index = self._entries[key]
+                if expires_at <= now:
+                    self._remove(key)
+                    continue
+                if key[1] <= start and end <= key[2]:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return busy_index
+            self.misses += 1
+            return None
+
+    def put(self, user_key, start, end, busy_index):
+        """Cache busy_index as the user's busy periods for [start, end)"""
+        key = (user_key, start, end)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, busy_index)
+            self._by_user.setdefault(user_key, set()).add(key)
+            self._evict()
+
+    def add_busy(self, user_key, start, end):
+        """Patch a newly created event into every cached window of the user"""
+        with self._lock:
+            for key in self._by_user.get(user_key, ()):
+                if start < key[2] and key[1] < end:
+                    self._entries[key][1].add(start, end)
+
+    def invalidate(self, user_key):
+        """Drop every cached window of the user"""
+        with self._lock:
+            for key in list(self._by_user.get(user_key, ())):
+                self._remove(key)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "intervals": self._interval_count(),
+            }
+
+    def _remove(self, key):
+        del self._entries[key]
+        user_keys = self._by_user[key[0]]
+        user_keys.discard(key)
+        if not user_keys:
+            del self._by_user[key[0]]
+
+    def _interval_count(self):
+        return sum(len(busy_index) for _, busy_index in self._entries.values())
+
+    def _evict(self):
+        # Least recently used entries go first; the newest entry always stays
+        total = self._interval_count()
+        while total > self.max_intervals and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            total -= len(self._entries[key][1])
+            self._remove(key)
+
+freebusy_cache = FreeBusyCache()
@@ -1,82 +1,301 @@
 # googleCalendar.py
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import heapq
+import httplib2
 import json
-from datetime import datetime, timedelta
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from availability import BusyIndex, parse_timestamp
+from metrics import span
+
+# Calendar v3 discovery document, parsed once from the static copy bundled
+# with googleapiclient so building a service never touches the network
+_calendar_discovery = get_static_doc('calendar', 'v3')
+if _calendar_discovery is None:
+    raise RuntimeError("googleapiclient is missing its bundled calendar v3 discovery document")
+CALENDAR_DISCOVERY_DOC = json.loads(_calendar_discovery)
+
+# Page size for events().list (Google allows up to 2500)
+EVENT_PAGE_SIZE = int(os.getenv("EVENT_PAGE_SIZE", "250"))
+
+# Partial response with just what analyze_event_patterns needs
+EVENT_PATTERN_FIELDS = "items(start),nextPageToken"
+
+# Google accepts at most 50 calendars per freebusy query
+FREEBUSY_MAX_ITEMS = 50
+
+# Google accepts at most 50 calls per batch request
+CALENDAR_BATCH_LIMIT = 50
+
+# Seconds a user's calendar list stays cached
+CALENDAR_LIST_TTL = float(os.getenv("CALENDAR_LIST_TTL", "600"))
+
+# Users whose calendar lists are cached before the least recently used are evicted
+CALENDAR_LIST_MAX_USERS = int(os.getenv("CALENDAR_LIST_MAX_USERS", "1000"))
+
+# credentials key -> (expires_at, calendar ids), least recently used first
+_calendar_ids_cache = OrderedDict()
+_calendar_ids_lock = threading.Lock()
+
+# Runs freebusy chunks in parallel; separate from the request-level pool in
+# calendarClient so nested waits can't exhaust it
+_freebusy_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="freebusy")
 
 def build_credentials(session_creds):
     """Rebuild Google OAuth2 credentials from session data"""
-    return Credentials(
-        token=session_creds.get("token"),
-        refresh_token=session_creds.get("refresh_token"),
-        token_uri=session_creds.get("token_uri"),
-        client_id=session_creds.get("client_id"),
-        client_secret=session_creds.get("client_secret"),
-        scopes=session_creds.get("scopes")
-    )
-
-def get_calendar_events(credentials, time_min, time_max):
-    """Get calendar events in the specified time range"""
-    try:
+    # Naive UTC ISO string, as Credentials.expiry expects
+    expiry = session_creds.get("expiry")
+    with span("credentials_build"):
+        return Credentials(
+            token=session_creds.get("token"),
+            refresh_token=session_creds.get("refresh_token"),
+            token_uri=session_creds.get("token_uri"),
+            client_id=session_creds.get("client_id"),
+            client_secret=session_creds.get("client_secret"),
+            scopes=session_creds.get("scopes"),
+            expiry=datetime.fromisoformat(expiry) if expiry else None
+        )
+
+def credentials_key(credentials):
+    """Stable per-user key for session credentials or a Credentials object"""
+    if isinstance(credentials, dict):
+        client_id = credentials.get("client_id")
+        secret = credentials.get("refresh_token") or credentials.get("token")
+    else:
+        client_id = credentials.client_id
+        secret = credentials.refresh_token or credentials.token
+    return hashlib.sha256(f"{client_id}:{secret}".encode()).hexdigest()
+
+class CalendarServiceFactory:
+    """Reuses Calendar service objects (and their HTTP connections) per credential.
+
+    httplib2 connections aren't thread-safe, so every worker thread keeps its
+    own small LRU of services.
+    """
+
+    def __init__(self, max_per_thread=64):
+        self.max_per_thread = max_per_thread
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def get(self, credentials):
+        """Return a cached service for these credentials, building one on a miss"""
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = OrderedDict()
+
+        key = credentials_key(credentials)
+        service = services.get(key)
+        if service is not None:
+            services.move_to_end(key)
+            with self._lock:
+                self.hits += 1
+            return service
+
+        with self._lock:
+            self.misses += 1
+
         # If we received session credentials dict, rebuild proper credentials
         if isinstance(credentials, dict):
             credentials = build_credentials(credentials)
-            
-        service = build('calendar', 'v3', credentials=credentials)
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        return events_result.get('items', [])
+
+        # A dedicated Http per service keeps its connection alive between calls
+        with span("service_build"):
+            http = AuthorizedHttp(credentials, http=httplib2.Http())
+            service = build_from_document(CALENDAR_DISCOVERY_DOC, http=http)
+
+        services[key] = service
+        if len(services) > self.max_per_thread:
+            services.popitem(last=False)
+        return service
+
+    def stats(self):
+        """Hit/miss counters for the service cache"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+calendar_services = CalendarServiceFactory()
+
+def get_calendar_service(credentials):
+    """Get a Calendar v3 service for session credentials or a Credentials object"""
+    return calendar_services.get(credentials)
+
+def _iter_event_pages(service, params):
+    """Yield raw events().list responses, following nextPageToken"""
+    while True:
+        events_result = service.events().list(**params).execute()
+        yield events_result
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return
+        params["pageToken"] = page_token
+
+def iter_calendar_events(credentials, time_min, time_max, max_results=EVENT_PAGE_SIZE, fields=None):
+    """Yield calendar events in the specified time range, fetching one page at a time.
+
+    fields is a partial-response projection such as EVENT_PATTERN_FIELDS; it must
+    keep nextPageToken so pagination still works.
+    """
+    service = get_calendar_service(credentials)
+    params = {
+        "calendarId": 'primary',
+        "timeMin": time_min,
+        "timeMax": time_max,
+        "singleEvents": True,
+        "orderBy": 'startTime',
+        "maxResults": max_results
+    }
+    if fields:
+        params["fields"] = fields
+    
+    for events_result in _iter_event_pages(service, params):
+        yield from events_result.get('items', [])
+
+def list_event_changes(credentials, sync_token=None, time_min=None):
+    """Page through primary-calendar events for an incremental sync.
+
+    Pass time_min for the initial full sync or sync_token for a delta sync.
+    Returns (items, next_sync_token); deleted events come back with status
+    'cancelled'. An expired sync token raises HttpError with status 410.
+    """
+    try:
+        service = get_calendar_service(credentials)
+        params = {
+            "calendarId": 'primary',
+            "singleEvents": True,
+            "maxResults": EVENT_PAGE_SIZE,
+            "fields": "items(id,status,start),nextPageToken,nextSyncToken"
+        }
+        if sync_token:
+            params["syncToken"] = sync_token
+        elif time_min:
+            params["timeMin"] = time_min
+        
+        items = []
+        for events_result in _iter_event_pages(service, params):
+            items.extend(events_result.get('items', []))
+        
+        # The sync token is only returned on the last page
+        return items, events_result.get('nextSyncToken')
     except HttpError as error:
         raise
     except Exception as e:
         raise
 
-def get_freebusy_data(credentials, time_min, time_max):
-    """Get free/busy data for the specified time range"""
+def get_calendar_ids(credentials):
+    """IDs of every calendar in the user's calendar list, cached per user"""
+    key = credentials_key(credentials)
+    now = time.monotonic()
+    with _calendar_ids_lock:
+        cached = _calendar_ids_cache.get(key)
+        if cached:
+            if cached[0] > now:
+                _calendar_ids_cache.move_to_end(key)
+                return cached[1]
+            del _calendar_ids_cache[key]
+    
     try:
-        # If we received session credentials dict, rebuild proper credentials
-        if isinstance(credentials, dict):
-            credentials = build_credentials(credentials)
-            
-        service = build('calendar', 'v3', credentials=credentials)
-        
-        # Request free/busy information from all calendars
-        body = {
-            "timeMin": time_min,
-            "timeMax": time_max,
-            "items": [
-                {"id": "primary"},  # Primary calendar
-                # Add more calendars as needed - could fetch user's calendar list first
-            ],
-            "timeZone": "UTC"
-        }
-        
-        freebusy_result = service.freebusy().query(body=body).execute()
-        
-        # Combine busy periods from all calendars
-        all_busy = []
-        for calendar_id, calendar_data in freebusy_result.get('calendars', {}).items():
-            busy_periods = calendar_data.get('busy', [])
-            all_busy.extend(busy_periods)
-            
-        # Sort busy periods by start time
-        all_busy.sort(key=lambda x: x['start'])
-        
-        # Merge overlapping busy periods
-        merged_busy = []
-        for busy in all_busy:
-            if not merged_busy or busy['start'] > merged_busy[-1]['end']:
-                merged_busy.append(busy)
-            else:
-                merged_busy[-1]['end'] = max(merged_busy[-1]['end'], busy['end'])
-                
-        return {'busy': merged_busy}
+        service = get_calendar_service(credentials)
+        params = {"fields": "items(id),nextPageToken", "maxResults": 250}
+        calendar_ids = []
+        while True:
+            calendar_list = service.calendarList().list(**params).execute()
+            calendar_ids.extend(item['id'] for item in calendar_list.get('items', []))
+            page_token = calendar_list.get('nextPageToken')
+            if not page_token:
+                break
+            params["pageToken"] = page_token
+    except HttpError as error:
+        raise
+    except Exception as e:
+        raise
+    
+    # Always include the primary calendar even if the list is empty
+    calendar_ids = calendar_ids or ['primary']
+    with _calendar_ids_lock:
+        _calendar_ids_cache[key] = (now + CALENDAR_LIST_TTL, calendar_ids)
+        _calendar_ids_cache.move_to_end(key)
+        while len(_calendar_ids_cache) > CALENDAR_LIST_MAX_USERS:
+            _calendar_ids_cache.popitem(last=False)
+    return calendar_ids
+
+def _query_freebusy_chunk(credentials, time_min, time_max, calendar_ids):
+    """Busy lists and errors for up to FREEBUSY_MAX_ITEMS calendars in a single freebusy query"""
+    service = get_calendar_service(credentials)
+    body = {
+        "timeMin": time_min,
+        "timeMax": time_max,
+        "items": [{"id": calendar_id} for calendar_id in calendar_ids],
+        "timeZone": "UTC"
+    }
+    freebusy_result = service.freebusy().query(body=body).execute()
+    calendars = freebusy_result.get('calendars', {})
+    busy_by_calendar = {}
+    errors_by_calendar = {}
+    for calendar_id in calendar_ids:
+        calendar = calendars.get(calendar_id)
+        if calendar is None:
+            errors_by_calendar[calendar_id] = [{"reason": "notFound"}]
+        elif calendar.get('errors'):
+            # Calendars we can't read come back with 'errors' and no busy periods
+            errors_by_calendar[calendar_id] = calendar['errors']
+        else:
+            busy_by_calendar[calendar_id] = calendar.get('busy', [])
+    return busy_by_calendar, errors_by_calendar
+
+def query_busy_lists(credentials, time_min, time_max, calendar_ids):
+    """Busy periods per readable calendar ID plus Google's errors per unreadable one.
+
+    Chunks of FREEBUSY_MAX_ITEMS are queried concurrently. Returns
+    (busy_by_calendar, errors_by_calendar).
+    """
+    chunks = [calendar_ids[i:i + FREEBUSY_MAX_ITEMS] for i in range(0, len(calendar_ids), FREEBUSY_MAX_ITEMS)]
+    if len(chunks) == 1:
+        return _query_freebusy_chunk(credentials, time_min, time_max, chunks[0])
+    
+    futures = [
+        _freebusy_executor.submit(_query_freebusy_chunk, credentials, time_min, time_max, chunk)
+        for chunk in chunks
+    ]
+    busy_by_calendar = {}
+    errors_by_calendar = {}
+    for future in futures:
+        busy, errors = future.result()
+        busy_by_calendar.update(busy)
+        errors_by_calendar.update(errors)
+    return busy_by_calendar, errors_by_calendar
+
+def merge_busy_lists(busy_lists):
+    """Merge several start-sorted busy lists into one BusyIndex of non-overlapping periods.
+
+    Uses a heap-based k-way merge, so the already-sorted lists from Google are
+    never concatenated and re-sorted, and the merged epoch intervals go straight
+    into the index without a round trip through ISO strings.
+    """
+    keyed_lists = []
+    for busy_list in busy_lists:
+        intervals = ((parse_timestamp(busy['start']), parse_timestamp(busy['end'])) for busy in busy_list)
+        keyed_lists.append([(start, end) for start, end in intervals if end > start])
+    return BusyIndex.from_sorted_intervals(heapq.merge(*keyed_lists))
+
+def get_busy_index(credentials, time_min, time_max):
+    """Merged busy periods across all of the user's calendars for the specified time range"""
+    try:
+        calendar_ids = get_calendar_ids(credentials)
+        # The user's own unreadable calendars (e.g. a removed subscription) are skipped
+        busy_by_calendar, _ = query_busy_lists(credentials, time_min, time_max, calendar_ids)
+        return merge_busy_lists(busy_by_calendar.values())
     
     except HttpError as error:
         raise
@@ -86,11 +305,7 @@ def get_freebusy_data(credentials, time_min, time_max):
 def create_calendar_event(credentials, event_data):
     """Create a new event in the user's primary calendar"""
     try:
-        # If we received session credentials dict, rebuild proper credentials
-        if isinstance(credentials, dict):
-            credentials = build_credentials(credentials)
-            
-        service = build('calendar', 'v3', credentials=credentials)
+        service = get_calendar_service(credentials)
         event = service.events().insert(
             calendarId='primary',
             body=event_data
@@ -101,6 +316,44 @@ def create_calendar_event(credentials, event_data):
     except Exception as e:
         raise
 
+def get_calendar_event(credentials, event_id):
+    """Get one event from the user's primary calendar; deleted events have status 'cancelled'"""
+    try:
+        service = get_calendar_service(credentials)
+        return service.events().get(calendarId='primary', eventId=event_id).execute()
+    except HttpError as error:
+        raise
+    except Exception as e:
+        raise
+
+def create_calendar_events(credentials, events_data):
+    """Create several events in the user's primary calendar using batch requests.
+
+    Up to CALENDAR_BATCH_LIMIT inserts share one HTTP request. Returns an
+    (event, error) pair per input in the same order; one of the two is None.
+    A batch request that fails as a whole only marks its own events as errors.
+    """
+    service = get_calendar_service(credentials)
+    results = [None] * len(events_data)
+
+    def record(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    for offset in range(0, len(events_data), CALENDAR_BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=record)
+        for index in range(offset, min(offset + CALENDAR_BATCH_LIMIT, len(events_data))):
+            batch.add(
+                service.events().insert(calendarId='primary', body=events_data[index]),
+                request_id=str(index)
+            )
+        try:
+            batch.execute()
+        except Exception as e:
+            for index in range(offset, min(offset + CALENDAR_BATCH_LIMIT, len(events_data))):
+                if results[index] is None:
+                    results[index] = (None, e)
+    return results
+
 # For testing when real auth isn't available
 def mock_freebusy_data(time_min, time_max):
     """Generate mock busy times for testing"""
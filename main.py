@@ -1,29 +1,50 @@
 # main.py
-from fastapi import FastAPI, Depends, HTTPException, Request, status
+from dotenv import load_dotenv
+
+# Load environment variables from .env file before modules read their settings
+load_dotenv()
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, status
 from auth import router as auth_router
-from googleCalendar import get_calendar_events, get_freebusy_data, create_calendar_event, mock_freebusy_data
+from googleCalendar import mock_freebusy_data
+from calendarClient import (
+    fetch_busy_index, fetch_schedule_data_or_snapshot, fetch_group_busy_index, insert_event, insert_events,
+    calendar_breaker, is_outage, is_auth_failure
+)
+from availabilitySnapshots import availability_snapshots
 from scheduler import rank_time_slots
+from availability import BusyIndex, filter_available
+from slots import SlotGrid, SlotIndex
 from datetime import datetime, timedelta, timezone
+from itertools import islice, takewhile
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.security import OAuth2PasswordBearer
 import json
 import os
-from starlette.middleware.sessions import SessionMiddleware
-import re
-import requests
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+from sessionStore import ServerSessionMiddleware, create_session_store
+from credentialManager import CredentialManager
+from eventQueue import EventQueue, EventQueueFull, event_id_for, live_event
+from googleapiclient.errors import HttpError
+from singleflight import SingleFlight
+from metrics import METRICS_ENABLED, MetricsMiddleware, registry as metrics_registry, span
+from googleCalendar import calendar_services, credentials_key
+from freebusyCache import freebusy_cache
+from openaiClient import OpenAIClient
+from commandCache import create_command_cache
+from commandParser import parse_command, is_confident
 
 app = FastAPI()
 app.include_router(auth_router)
 
-# Session middleware for storing auth state
-app.add_middleware(SessionMiddleware, secret_key="your-secret-key-here")  # Use a strong secret in production
+# Session data (including credentials) stays server-side; the cookie only carries a signed session id
+session_store = create_session_store()
+app.add_middleware(ServerSessionMiddleware, store=session_store)
+
+# Live Credentials per user, refreshed before they expire and written back to the session store
+credential_manager = CredentialManager(session_store)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,15 +52,44 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Outermost, so request timings include the session and CORS middleware
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Longest horizon accepted by the group availability endpoint
+MAX_GROUP_DAYS_AHEAD = 28
+
+# Most events accepted by one /schedule/create/batch call
+MAX_BATCH_EVENTS = 500
+
+# Largest page of slots /schedule returns at once
+MAX_SCHEDULE_PAGE_SIZE = 500
+
+# Longest horizon accepted by /schedule/stream, and how many days of busy
+# periods it fetches at a time
+MAX_STREAM_DAYS_AHEAD = 366
+STREAM_CHUNK_DAYS = 7
+
 class EventCreate(BaseModel):
     start_time: str
     summary: str
     description: Optional[str] = None
 
+class BatchEventCreate(BaseModel):
+    events: List[EventCreate]
+
 class NaturalLanguageCommand(BaseModel):
     command: str
+    tz: Optional[str] = None
+
+class GroupAvailabilityRequest(BaseModel):
+    attendees: List[str]
+    days_ahead: int = 5
+    include_self: bool = True
+    tz: Optional[str] = None
 
 # Mock credentials for development - in production use proper auth flow
 class MockCredentials:
@@ -47,14 +97,61 @@ class MockCredentials:
         self.token = token
 
 # Update the get_credentials function
-def get_credentials(request: Request):
-    """Get credentials from session or return mock credentials"""
+async def get_credentials(request: Request):
+    """Get the user's live Credentials object, or None when not authenticated"""
     credentials = request.session.get("credentials")
     if not credentials:
         return None
     
-    # Return the credentials dictionary from session
-    return credentials
+    # Shared by all of the user's requests; an expired token is refreshed once here
+    return await credential_manager.get_credentials(request.scope.get("session_id"), credentials)
+
+@app.on_event("startup")
+async def start_credential_manager():
+    credential_manager.start()
+
+@app.on_event("shutdown")
+async def stop_credential_manager():
+    await credential_manager.stop()
+
+# Background inserts for /schedule/create?background=true
+event_queue = EventQueue()
+
+@app.on_event("startup")
+async def start_event_queue():
+    event_queue.start()
+
+@app.on_event("shutdown")
+async def stop_event_queue():
+    await event_queue.stop()
+
+def build_slot_grid(tz=None, duration_minutes=None, step_minutes=None, workday_start=None, workday_end=None):
+    """SlotGrid from request parameters, using the configured defaults for any left out"""
+    options = {
+        "tz": tz,
+        "duration_minutes": duration_minutes,
+        "step_minutes": step_minutes,
+        "workday_start": workday_start,
+        "workday_end": workday_end,
+    }
+    try:
+        return SlotGrid(**{name: value for name, value in options.items() if value is not None})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def decode_cursor(cursor):
+    """Epoch seconds of the last slot on the previous page"""
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def load_busy_index(credentials, time_min, time_max):
+    """Busy periods from Google Calendar (or the per-user cache), or mock data without credentials"""
+    if credentials is not None:
+        return await fetch_busy_index(credentials, time_min, time_max)
+    freebusy_data = mock_freebusy_data(time_min, time_max)
+    return BusyIndex.from_periods(freebusy_data.get('busy', []))
 
 @app.get("/auth/status")
 async def auth_status(request: Request):
@@ -63,392 +160,477 @@ async def auth_status(request: Request):
     return {"authenticated": credentials is not None}
 
 @app.get("/schedule")
-async def get_schedule(request: Request, days_ahead: Optional[int] = 5, selected_date: Optional[str] = None):
+async def get_schedule(request: Request, days_ahead: Optional[int] = 5, selected_date: Optional[str] = None,
+                       tz: Optional[str] = None, duration_minutes: Optional[int] = None,
+                       step_minutes: Optional[int] = None, workday_start: Optional[int] = None,
+                       workday_end: Optional[int] = None, cursor: Optional[str] = None, limit: int = 50):
+    """Available slots a page at a time; pass next_cursor back as cursor for the next page"""
+    # Slot length, spacing, working hours and timezone for this request
+    grid = build_slot_grid(tz, duration_minutes, step_minutes, workday_start, workday_end)
+    if not 1 <= limit <= MAX_SCHEDULE_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SCHEDULE_PAGE_SIZE}")
+    resume_after = decode_cursor(cursor) if cursor else None
+    
     try:
-        # Time range for availability check
-        now = datetime.now(timezone.utc)
+        # Time range for availability check, rounded down to the minute so identical
+        # requests arriving close together share one computation (slots start on
+        # whole minutes, so none in the past slips through)
+        now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        
+        # Resume after the last slot of the previous page
+        after = now.timestamp()
+        if resume_after is not None:
+            after = max(after, resume_after)
         
         # If a specific date is selected, only fetch data for that date
         if selected_date:
             try:
                 # Parse the selected date
                 selected_dt = datetime.fromisoformat(selected_date.replace('Z', '+00:00'))
-                # Set time range to just that day
-                time_min = datetime(selected_dt.year, selected_dt.month, selected_dt.day, 0, 0, tzinfo=timezone.utc).isoformat()
-                time_max = datetime(selected_dt.year, selected_dt.month, selected_dt.day, 23, 59, tzinfo=timezone.utc).isoformat()
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid date format")
+            # Set time range to just that day in the user's timezone
+            first_day, days = selected_dt.date(), 1
+            time_min = grid.day_start(first_day).isoformat()
         else:
             # Default behavior - fetch next 5 days
-            time_min = now.isoformat()
-            time_max = (now + timedelta(days=days_ahead)).isoformat()
+            first_day, days = grid.today(now), days_ahead
+            time_min = datetime.fromtimestamp(after, timezone.utc).isoformat()
+        time_max = grid.day_start(first_day + timedelta(days=days)).isoformat()
         
         # Get credentials from session
-        credentials = get_credentials(request)
-        use_real_calendar = credentials is not None and "token" in credentials
+        credentials = await get_credentials(request)
+        use_real_calendar = credentials is not None
         
         try:
-            # Use real calendar data if we have valid credentials
-            if use_real_calendar:
-                # Get actual free/busy data from Google Calendar API
-                freebusy_data = get_freebusy_data(credentials, time_min, time_max)
-                busy_periods = freebusy_data.get('busy', [])
-                
-                # Get the user's calendar information for better recommendations
-                calendar_events = get_calendar_events(credentials, time_min, time_max)
-                
-                # Extract event metadata for better contextual recommendations
-                event_patterns = analyze_event_patterns(calendar_events)
-                context_info = f"User has {len(calendar_events)} events scheduled. " + event_patterns
-            else:
-                # Use mock data for development without real auth
-                freebusy_data = mock_freebusy_data(time_min, time_max)
-                busy_periods = freebusy_data.get('busy', [])
-                context_info = "User prefers afternoon meetings on Tuesdays and morning meetings on Thursdays."
-            
-            # Generate available time slots (9 AM to 7 PM, hourly slots)
-            all_slots = []
-            
-            # If a specific date is selected, only generate slots for that date
-            if selected_date:
-                date = datetime.fromisoformat(selected_date.replace('Z', '+00:00'))
-                # Generate slots for 9 AM to 7 PM with 30-min intervals
-                for hour in range(9, 21):  # End at 8:30 PM for 1-hour slots
-                    for minute in [0, 30]:  # Add 30-minute intervals
-                        slot_time = datetime(
-                            date.year, date.month, date.day, 
-                            hour, minute, tzinfo=timezone.utc
-                        )
-                        
-                        # Skip slots in the past
-                        if slot_time <= now:
-                            continue
-                            
-                        # Format as ISO string - includes timezone info with Z suffix
-                        slot_str = slot_time.isoformat()
-                        
-                        # Check if slot conflicts with busy periods
-                        is_available = True
-                        for busy in busy_periods:
-                            # Make sure both times have proper timezone information
-                            busy_start = busy['start']
-                            busy_end = busy['end']
-                            
-                            # Ensure we have timezone info - use UTC (Z) if none provided
-                            if 'Z' not in busy_start and '+' not in busy_start and '-' not in busy_start:
-                                busy_start = busy_start + 'Z'
-                            if 'Z' not in busy_end and '+' not in busy_end and '-' not in busy_end:
-                                busy_end = busy_end + 'Z'
-                                
-                            # Parse to datetime objects with timezone
-                            busy_start = datetime.fromisoformat(busy_start.replace('Z', '+00:00'))
-                            busy_end = datetime.fromisoformat(busy_end.replace('Z', '+00:00'))
-                            
-                            # 1-hour slots, so check if any part overlaps with busy period
-                            slot_end = slot_time + timedelta(hours=1)
-                            
-                            # If slot overlaps with busy period, mark as unavailable
-                            if (busy_start <= slot_time < busy_end) or \
-                               (busy_start < slot_end <= busy_end) or \
-                               (slot_time <= busy_start and slot_end >= busy_end):
-                                is_available = False
-                                break
-                        
-                        if is_available:
-                            all_slots.append(slot_str)
-            else:
-                # Original behavior for multiple days
-                for day in range(days_ahead):
-                    date = now + timedelta(days=day)
-                    # Generate slots for 9 AM to 7 PM with 30-min intervals
-                    for hour in range(9, 19):  # End at 6:30 PM for 1-hour slots
-                        for minute in [0, 30]:  # Add 30-minute intervals
-                            slot_time = datetime(
-                                date.year, date.month, date.day, 
-                                hour, minute, tzinfo=timezone.utc
-                            )
-                            
-                            # Skip slots in the past
-                            if slot_time <= now:
-                                continue
-                                
-                            # Format as ISO string - includes timezone info with Z suffix
-                            slot_str = slot_time.isoformat()
-                            
-                            # Check if slot conflicts with busy periods
-                            is_available = True
-                            for busy in busy_periods:
-                                # Make sure both times have proper timezone information
-                                busy_start = busy['start']
-                                busy_end = busy['end']
-                                
-                                # Ensure we have timezone info - use UTC (Z) if none provided
-                                if 'Z' not in busy_start and '+' not in busy_start and '-' not in busy_start:
-                                    busy_start = busy_start + 'Z'
-                                if 'Z' not in busy_end and '+' not in busy_end and '-' not in busy_end:
-                                    busy_end = busy_end + 'Z'
-                                    
-                                # Parse to datetime objects with timezone
-                                busy_start = datetime.fromisoformat(busy_start.replace('Z', '+00:00'))
-                                busy_end = datetime.fromisoformat(busy_end.replace('Z', '+00:00'))
-                                
-                                # 1-hour slots, so check if any part overlaps with busy period
-                                slot_end = slot_time + timedelta(hours=1)
-                                
-                                # If slot overlaps with busy period, mark as unavailable
-                                if (busy_start <= slot_time < busy_end) or \
-                                   (busy_start < slot_end <= busy_end) or \
-                                   (slot_time <= busy_start and slot_end >= busy_end):
-                                    is_available = False
-                                    break
-                            
-                            if is_available:
-                                all_slots.append(slot_str)
-            
-            # Sort slots by date/time
-            all_slots.sort()
-            
-            # Use up to 50 available slots
-            available_slots = all_slots[:50]
-            
-            # Generate smart recommendations based on the calendar data
-            recommended_slots = get_recommended_slots(available_slots, context_info)
-            
-            # Include note about data source
-            response_data = {
-                "available_slots": available_slots,
-                "recommendations": recommended_slots
-            }
-            
-            if not use_real_calendar:
-                response_data["note"] = "Using mock calendar data. Connect with Google for real availability."
-                
-            return response_data
+            # Concurrent identical requests (same user, window, grid and page) wait on
+            # one upstream fetch and slot computation instead of each starting their own
+            user_key = credentials_key(credentials) if use_real_calendar else None
+            flight_key = (user_key, time_min, time_max, after, limit, grid.key(), first_day, days)
+            return await schedule_flights.do(
+                flight_key, build_schedule_response,
+                credentials, grid, first_day, days, after, time_min, time_max, limit
+            )
             
         except Exception as calendar_err:
-            # Fallback to mock data if calendar integration fails
-            available_slots = [
-                (now + timedelta(days=1, hours=10)).isoformat(),
-                (now + timedelta(days=1, hours=14)).isoformat(),
-                (now + timedelta(days=2, hours=9)).isoformat(),
-                (now + timedelta(days=2, hours=13)).isoformat(),
-                (now + timedelta(days=2, hours=16)).isoformat(),
-            ]
-            recommendation = "Based on your calendar availability, these are the open slots in the next few days."
-            
-            return {
-                "available_slots": available_slots,
-                "recommendations": recommendation,
-                "note": "Using fallback data due to calendar integration issues"
-            }
+            if is_auth_failure(calendar_err):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail=f"Google Calendar access was revoked or denied: {str(calendar_err)}"
+                )
+            if not is_outage(calendar_err):
+                raise
+            # Google is down and there is no recent snapshot of this user's availability
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Calendar availability is temporarily unavailable: {str(calendar_err)}"
+            )
             
+    except HTTPException:
+        raise
     except Exception as e:
         # Proper FastAPI error handling
         raise HTTPException(status_code=500, detail=f"Failed to process schedule: {str(e)}")
 
-# Helper functions for analyzing calendar patterns
-def analyze_event_patterns(calendar_events):
-    """Extract patterns from calendar events to provide context for recommendations"""
-    if not calendar_events:
-        return "No existing events found to analyze patterns."
+@app.get("/schedule/stream")
+async def stream_schedule(request: Request, days_ahead: int = 90, tz: Optional[str] = None,
+                          duration_minutes: Optional[int] = None, step_minutes: Optional[int] = None,
+                          workday_start: Optional[int] = None, workday_end: Optional[int] = None):
+    """Stream available slots as NDJSON, one line per day: {"date": ..., "slots": [...]}"""
+    grid = build_slot_grid(tz, duration_minutes, step_minutes, workday_start, workday_end)
+    if not 1 <= days_ahead <= MAX_STREAM_DAYS_AHEAD:
+        raise HTTPException(status_code=400, detail=f"days_ahead must be between 1 and {MAX_STREAM_DAYS_AHEAD}")
+    credentials = await get_credentials(request)
+    now = datetime.now(timezone.utc)
+    first_day = grid.today(now)
+    
+    async def day_lines():
+        # Busy periods are fetched a chunk of days at a time, so the first line goes out
+        # after one small lookup and only one chunk is held in memory
+        for chunk_offset in range(0, days_ahead, STREAM_CHUNK_DAYS):
+            chunk_day = first_day + timedelta(days=chunk_offset)
+            chunk_days = min(STREAM_CHUNK_DAYS, days_ahead - chunk_offset)
+            time_min = max(grid.day_start(chunk_day), now).isoformat()
+            time_max = grid.day_start(chunk_day + timedelta(days=chunk_days)).isoformat()
+            try:
+                busy_index = await load_busy_index(credentials, time_min, time_max)
+            except Exception as e:
+                yield json.dumps({"error": f"Failed to process schedule: {str(e)}"}) + "\n"
+                return
+            
+            for offset in range(chunk_days):
+                day = chunk_day + timedelta(days=offset)
+                candidates = grid.iter_slots(day, 1, after=now.timestamp())
+                slots = [slot.isoformat(grid.tz) for slot in filter_available(candidates, busy_index)]
+                yield json.dumps({"date": day.isoformat(), "slots": slots}) + "\n"
+    
+    return StreamingResponse(day_lines(), media_type="application/x-ndjson")
+
+# Shares in-flight /schedule computations between identical concurrent requests
+schedule_flights = SingleFlight()
+
+async def build_schedule_response(credentials, grid, first_day, days, after, time_min, time_max, limit):
+    """Fetch availability and build one page of the /schedule response"""
+    use_real_calendar = credentials is not None
+    
+    snapshot = None
+    
+    # Use real calendar data if we have valid credentials
+    if use_real_calendar:
+        # Get free/busy data and the user's event patterns (for better recommendations)
+        # from Google Calendar API concurrently; events are analyzed while streaming.
+        # If Google fails, the user's last good snapshot is used instead
+        busy_index, (event_count, event_patterns), timings, snapshot = await fetch_schedule_data_or_snapshot(
+            credentials, time_min, time_max
+        )
+        context_info = f"User has {event_count} events scheduled. " + event_patterns
+    else:
+        # Use mock data for development without real auth
+        freebusy_data = mock_freebusy_data(time_min, time_max)
+        busy_index = BusyIndex.from_periods(freebusy_data.get('busy', []))
+        context_info = "User prefers afternoon meetings on Tuesdays and morning meetings on Thursdays."
+    
+    # Candidate slots are generated lazily in time order (skipping the past and
+    # earlier pages) and checked against the busy periods in a single sweep; only
+    # one page (plus one slot to detect a next page) is ever built
+    with span("slot_generation"):
+        if snapshot is not None:
+            # Only offer slots inside the window the snapshot actually covers
+            candidates = grid.iter_slots(first_day, days, after=max(after, snapshot.start - 1))
+            candidates = takewhile(lambda slot: slot.end <= snapshot.end, candidates)
+        else:
+            candidates = grid.iter_slots(first_day, days, after=after)
+        page = list(islice(filter_available(candidates, busy_index), limit + 1))
+    available_slots = page[:limit]
+    
+    # Rank the page by the user's patterns in their local time
+    with span("ranking"):
+        recommended_slots, ranked_slots = rank_time_slots(available_slots, context_info, grid.tz)
+    
+    # Include note about data source; slots become ISO strings (with timezone info) only here
+    response_data = {
+        "available_slots": [slot.isoformat(grid.tz) for slot in available_slots],
+        "recommendations": recommended_slots,
+        "ranked_slots": ranked_slots,
+        "timezone": grid.tz.key,
+        "next_cursor": str(available_slots[-1].start) if len(page) > limit else None
+    }
+    
+    if snapshot is not None:
+        response_data["stale"] = True
+        response_data["stale_as_of"] = datetime.fromtimestamp(snapshot.fetched_at, timezone.utc).isoformat()
+        response_data["note"] = "Google Calendar is unavailable; showing your last known availability."
+    elif use_real_calendar:
+        # Per-call Google Calendar timings in milliseconds
+        response_data["stale"] = False
+        response_data["timings"] = timings
+    else:
+        response_data["note"] = "Using mock calendar data. Connect with Google for real availability."
         
-    # Count events by day of week
-    weekday_counts = [0] * 7  # Monday to Sunday
-    hour_counts = [0] * 24  # 0-23 hours
+    return response_data
+
+@app.post("/schedule/create")
+async def create_event(request: Request, event: EventCreate, background: bool = False,
+                       idempotency_key: Optional[str] = Header(None)):
+    """Create a new event in Google Calendar.
+
+    With background=true the event is validated, queued and a job id returned
+    at once; poll /schedule/jobs/{job_id} for the outcome. Resending the same
+    Idempotency-Key never creates a duplicate.
+    """
+    credentials = await get_credentials(request)
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated with Google Calendar"
+        )
     
-    for event in calendar_events:
+    if background:
         try:
-            start = event.get('start', {})
-            if 'dateTime' in start:
-                start_time = datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
-                weekday = start_time.weekday()
-                hour = start_time.hour
-                
-                weekday_counts[weekday] += 1
-                hour_counts[hour] += 1
-        except (ValueError, KeyError):
-            continue
+            event_details = build_event_body(event)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid start_time: {str(e)}")
+        try:
+            job = event_queue.submit(credentials, event_details, idempotency_key)
+        except EventQueueFull as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job.to_dict())
     
-    # Find preferred days and times
-    max_weekday = weekday_counts.index(max(weekday_counts))
-    weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    preferred_day = weekdays[max_weekday]
+    try:
+        event_details = build_event_body(event)
+        if idempotency_key:
+            # Same deterministic id as the background path, so a retry can't create a second event
+            event_details["id"] = event_id_for(credentials_key(credentials), idempotency_key)
+        try:
+            result = await insert_event(credentials, event_details)
+        except HttpError as error:
+            if error.resp.status != 409 or not idempotency_key:
+                raise
+            # An earlier request with this key created the event, unless it has since been deleted
+            result = await live_event(credentials, event_details["id"])
+            if result is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Event id belongs to a deleted event; resend with a new Idempotency-Key"
+                )
+        return {"status": "success", "event_id": result.get("id")}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create event: {str(e)}")
+
+@app.get("/schedule/jobs/{job_id}")
+async def get_event_job(request: Request, job_id: str):
+    """Status of a background event insert"""
+    credentials = await get_credentials(request)
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated with Google Calendar"
+        )
+    job = event_queue.get_job(job_id, credentials)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.post("/schedule/create/batch")
+async def create_events_batch(request: Request, batch: BatchEventCreate):
+    """Create many events with Google batch requests and report a result per event"""
+    credentials = await get_credentials(request)
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated with Google Calendar"
+        )
+    if not 1 <= len(batch.events) <= MAX_BATCH_EVENTS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BATCH_EVENTS} events are required")
     
-    # Check if mornings or afternoons are preferred
-    morning_count = sum(hour_counts[9:12])  # 9 AM to 12 PM
-    afternoon_count = sum(hour_counts[13:17])  # 1 PM to 5 PM
-    time_preference = "mornings" if morning_count > afternoon_count else "afternoons"
+    # Validate every payload up front; invalid ones are reported and never sent
+    results = [None] * len(batch.events)
+    bodies = []
+    positions = []
+    for index, event in enumerate(batch.events):
+        try:
+            bodies.append(build_event_body(event))
+            positions.append(index)
+        except ValueError as e:
+            results[index] = {"index": index, "status": "error", "error": f"Invalid start_time: {str(e)}"}
     
-    return f"User typically schedules meetings on {preferred_day} and prefers {time_preference}."
-
-def get_recommended_slots(available_slots, context_info):
-    """Get recommended slots based on availability and context"""
-    if not available_slots:
-        return "No available slots found in the specified time range."
-        
-    # Simple recommendation without AI - based on context info
-    if "mornings" in context_info.lower():
-        # Filter morning slots (before noon)
-        morning_slots = [slot for slot in available_slots if datetime.fromisoformat(slot.replace('Z', '+00:00')).hour < 12]
-        if morning_slots:
-            formatted_slots = [format_slot_for_display(slot) for slot in morning_slots[:3]]
-            return f"Based on your calendar patterns, you seem to prefer morning meetings. Here are some recommended morning slots:\n" + "\n".join(formatted_slots)
+    # Cached availability is invalidated once for the whole batch; a failed batch
+    # request only turns its own events into errors
+    outcomes = await insert_events(credentials, bodies) if bodies else []
     
-    if "afternoons" in context_info.lower():
-        # Filter afternoon slots (after noon)
-        afternoon_slots = [slot for slot in available_slots if datetime.fromisoformat(slot.replace('Z', '+00:00')).hour >= 12]
-        if afternoon_slots:
-            formatted_slots = [format_slot_for_display(slot) for slot in afternoon_slots[:3]]
-            return f"Based on your calendar patterns, you seem to prefer afternoon meetings. Here are some recommended afternoon slots:\n" + "\n".join(formatted_slots)
+    for index, (created, error) in zip(positions, outcomes):
+        if error is None:
+            results[index] = {"index": index, "status": "success", "event_id": created.get("id")}
+        else:
+            results[index] = {"index": index, "status": "error", "error": str(error)}
     
-    # Default recommendation - first 3 available slots
-    formatted_slots = [format_slot_for_display(slot) for slot in available_slots[:3]]
-    return f"Here are the most optimal slots based on your calendar:\n" + "\n".join(formatted_slots)
+    created_count = sum(1 for result in results if result["status"] == "success")
+    return {"created": created_count, "failed": len(results) - created_count, "results": results}
 
-def format_slot_for_display(slot_iso):
-    """Format ISO slot time for display in recommendations"""
-    dt = datetime.fromisoformat(slot_iso.replace('Z', '+00:00'))
-    return dt.strftime("%A, %B %d at %I:%M %p")
+def build_event_body(event: EventCreate):
+    """Google Calendar body for a 1-hour event; raises ValueError for a bad start_time"""
+    # Parse start time - keep the timezone information intact
+    start_time = event.start_time
+    
+    # If the start_time has no timezone info, assume UTC
+    if 'Z' not in start_time and '+' not in start_time and '-' not in start_time:
+        start_time += 'Z'
+        
+    # Parse to datetime to add an hour
+    start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+    end_dt = start_dt + timedelta(minutes=60)  # Default 1 hour event
+    
+    # Create event using ISO format strings with timezone information
+    return {
+        "summary": event.summary,
+        "description": event.description or "",
+        "start": {"dateTime": start_time},
+        "end": {"dateTime": end_dt.isoformat().replace('+00:00', 'Z')},
+    }
 
-@app.post("/schedule/create")
-async def create_event(request: Request, event: EventCreate):
-    """Create a new event in Google Calendar"""
-    credentials = request.session.get("credentials")
+@app.post("/schedule/group")
+async def get_group_schedule(request: Request, group_request: GroupAvailabilityRequest):
+    """Find slots where every attendee (and by default the current user) is free"""
+    credentials = await get_credentials(request)
     if not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated with Google Calendar"
         )
     
+    # Drop duplicate attendees while keeping their order
+    calendar_ids = list(dict.fromkeys(email.strip() for email in group_request.attendees if email.strip()))
+    if not calendar_ids and not group_request.include_self:
+        raise HTTPException(status_code=400, detail="At least one attendee is required")
+    if not 1 <= group_request.days_ahead <= MAX_GROUP_DAYS_AHEAD:
+        raise HTTPException(status_code=400, detail=f"days_ahead must be between 1 and {MAX_GROUP_DAYS_AHEAD}")
+    grid = build_slot_grid(group_request.tz)
+    
     try:
-        # Parse start time - keep the timezone information intact
-        start_time = event.start_time
+        now = datetime.now(timezone.utc)
+        time_max = grid.day_start(grid.today(now) + timedelta(days=group_request.days_ahead))
         
-        # If the start_time has no timezone info, assume UTC
-        if 'Z' not in start_time and '+' not in start_time and '-' not in start_time:
-            start_time += 'Z'
-            
-        # Parse to datetime to add an hour
-        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-        end_dt = start_dt + timedelta(minutes=60)  # Default 1 hour event
-        
-        # Create event using ISO format strings with timezone information
-        event_details = {
-            "summary": event.summary,
-            "description": event.description or "",
-            "start": {"dateTime": start_time},
-            "end": {"dateTime": end_dt.isoformat().replace('+00:00', 'Z')},
+        # One batched freebusy lookup for everyone (and all of the user's own calendars),
+        # merged into a single busy index
+        busy_index, errors_by_calendar = await fetch_group_busy_index(
+            credentials, calendar_ids, now.isoformat(), time_max.isoformat(),
+            include_self=group_request.include_self
+        )
+        # Attendees whose calendars Google wouldn't share are left out of the busy index,
+        # so the slots only account for everyone else
+        unavailable_attendees = [
+            {"attendee": calendar_id, "reason": errors_by_calendar[calendar_id][0].get("reason", "unknown")}
+            for calendar_id in calendar_ids if calendar_id in errors_by_calendar
+        ]
+        
+        # Common free slots and the raw windows where nobody is busy
+        available_slots = generate_available_slots(now, group_request.days_ahead, busy_index, grid)
+        free_windows = [
+            {
+                "start": datetime.fromtimestamp(start, grid.tz).isoformat(),
+                "end": datetime.fromtimestamp(end, grid.tz).isoformat()
+            }
+            for start, end in busy_index.free_windows(now.timestamp(), time_max.timestamp())
+        ]
+        
+        response_data = {
+            "attendees": (['primary'] if group_request.include_self else []) + calendar_ids,
+            "available_slots": [slot.isoformat(grid.tz) for slot in available_slots],
+            "free_windows": free_windows,
+            "unavailable_attendees": unavailable_attendees,
+            "timezone": grid.tz.key
         }
-        
-        result = create_calendar_event(credentials, event_details)
-        return {"status": "success", "event_id": result.get("id")}
-        
+        if unavailable_attendees:
+            response_data["note"] = "Some attendees' availability couldn't be read; slots ignore their calendars."
+        return response_data
+    
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create event: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to find group availability: {str(e)}")
 
 # Get OpenAI API key from .env file
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Shared async client so completions reuse pooled connections
+openai_client = OpenAIClient(OPENAI_API_KEY)
+
+# Parses of recent commands, so repeated commands skip the LLM call
+command_cache = create_command_cache()
+
+@app.on_event("shutdown")
+async def close_openai_client():
+    await openai_client.aclose()
+
 @app.post("/schedule/process-command")
 async def process_command(request: Request, command_request: NaturalLanguageCommand):
     """Process natural language scheduling commands"""
-    credentials = request.session.get("credentials")
+    credentials = await get_credentials(request)
     if not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated with Google Calendar"
         )
+    # Slots are laid out, matched and displayed in the user's timezone
+    grid = build_slot_grid(command_request.tz)
         
     try:
         command = command_request.command
         
         # Get current available slots
         now = datetime.now(timezone.utc)
-        time_max = (now + timedelta(days=14)).isoformat()
+        time_max = grid.day_start(grid.today(now) + timedelta(days=14)).isoformat()
         
-        # Get actual free/busy data from Google Calendar API
-        freebusy_data = get_freebusy_data(credentials, now.isoformat(), time_max)
-        busy_periods = freebusy_data.get('busy', [])
+        # Get actual free/busy data from Google Calendar API (or the per-user cache)
+        busy_index = await fetch_busy_index(credentials, now.isoformat(), time_max)
         
         # Generate all available slots
-        available_slots = generate_available_slots(now, 14, busy_periods)
+        available_slots = generate_available_slots(now, 14, busy_index, grid)
         
         # Filter out any slots that are in the past (just to be absolutely sure)
-        current_time = datetime.now(timezone.utc)
-        available_slots = [slot for slot in available_slots if datetime.fromisoformat(slot.replace('Z', '+00:00')) > current_time]
+        current_time = datetime.now(timezone.utc).timestamp()
+        available_slots = [slot for slot in available_slots if slot.start > current_time]
+        
+        # Parse locally first; confident commands with an exact slot skip the LLM entirely
+        # Relative dates ("tomorrow") are resolved against the user's local date
+        with span("command_parse"):
+            parsed = parse_command(command, clock=lambda: datetime.now(grid.tz).replace(tzinfo=None))
+        event_name = parsed['event_name']
+        description = parsed['description']
+        matching_candidates = available_slots
+        duration = parsed['duration_minutes']
+        if duration and duration * 60 != grid.duration:
+            # The grid's slots were only checked free for its own length, so match the
+            # requested one ("for 2 hours") on a grid of that duration
+            event_grid = SlotGrid(duration, grid.step // 60, grid.workday_start, grid.workday_end, grid.tz)
+            matching_candidates = generate_available_slots(now, 14, busy_index, event_grid)
+        matching_slots = find_matching_slots(
+            SlotIndex(matching_candidates, grid.tz), parsed['event_date'], parsed['event_time']
+        )
+        if is_confident(parsed):
+            exact_slot = find_exact_slot(matching_slots, parsed['event_time'], grid.tz)
+            if exact_slot:
+                return build_found_slot_response(exact_slot, event_name, description, grid.tz)
         
-        # Format the available slots for the OpenAI API with timezone adjustment
+        # Format the available slots for the OpenAI API in the user's timezone
         formatted_slots = []
         for slot in available_slots[:20]:  # Limit to first 20 slots to keep prompt size reasonable
-            slot_dt = datetime.fromisoformat(slot.replace('Z', '+00:00'))
-            # Adjust for timezone (+2 hours)
-            adjusted_dt = slot_dt + timedelta(hours=2)
-            formatted_slots.append(f"{slot} - {adjusted_dt.strftime('%A, %B %d at %I:%M %p')}")
+            local_dt = slot.to_datetime(grid.tz)
+            formatted_slots.append(f"{local_dt.isoformat()} - {local_dt.strftime('%A, %B %d at %I:%M %p')}")
         
         available_slots_str = "\n".join(formatted_slots)
         
         # Use OpenAI to extract event info and find the best slot
-        openai_response = process_with_openai(command, available_slots_str)
+        openai_response = await process_with_openai(command, available_slots_str, grid.tz)
         
         if openai_response and openai_response.get("found_slot"):
             return openai_response
+        
+        # Fallback to the local parse if OpenAI fails
+        if matching_slots:
+            return build_found_slot_response(matching_slots[0], event_name, description, grid.tz)
         else:
-            # Fallback to simple extraction if OpenAI fails
-            event_name, event_date, event_time, description = extract_event_info(command.lower())
-            
-            # Find matching slots
-            matching_slots = find_matching_slots(available_slots, event_date, event_time)
-            
-            if matching_slots:
-                best_slot = matching_slots[0]
-                # Always use consistent date formatting for the message
-                try:
-                    slot_dt = datetime.fromisoformat(best_slot.replace('Z', '+00:00'))
-                    # Adjust for timezone (+2 hours)
-                    adjusted_dt = slot_dt + timedelta(hours=2)
-                    friendly_date = adjusted_dt.strftime("%A, %B %d at %I:%M %p")
-                    
-                    # Also adjust the actual slot time by +2 hours
-                    best_slot = adjusted_dt.isoformat()
-                except Exception:
-                    friendly_date = "the requested time"
-                
-                # Use default event name if none extracted
-                if not event_name:
-                    event_name = "Event"
-                    
-                return {
-                    "found_slot": best_slot,
-                    "event_name": event_name,
-                    "event_description": description,
-                    "message": f"Found a slot for '{event_name}' on {friendly_date}. Click 'Schedule Event' to confirm."
-                }
-            else:
-                return {
-                    "found_slot": None,
-                    "event_name": event_name,
-                    "event_description": description,
-                    "message": f"Could not find an available slot for '{event_name}' on the requested date/time. Please select a date and time manually."
-                }
+            return {
+                "found_slot": None,
+                "event_name": event_name,
+                "event_description": description,
+                "message": f"Could not find an available slot for '{event_name}' on the requested date/time. Please select a date and time manually."
+            }
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process command: {str(e)}")
 
-def process_with_openai(command, available_slots):
-    """Use OpenAI API to process the natural language command and find a matching slot"""
+def build_found_slot_response(best_slot, event_name, description, tz=timezone.utc):
+    """Response for a Slot matched by the local parser, in local time for tz"""
+    # Always use consistent date formatting for the message
+    local_dt = best_slot.to_datetime(tz)
+    friendly_date = local_dt.strftime("%A, %B %d at %I:%M %p")
+    
+    # Use default event name if none extracted
+    if not event_name:
+        event_name = "Event"
+        
+    return {
+        "found_slot": local_dt.isoformat(),
+        "event_name": event_name,
+        "event_description": description,
+        "message": f"Found a slot for '{event_name}' on {friendly_date}. Click 'Schedule Event' to confirm."
+    }
+
+async def process_with_openai(command, available_slots, tz=timezone.utc):
+    """Use OpenAI API to process the natural language command and find a matching slot.
+
+    Parses are cached by normalized command and slot list; cached and fresh
+    parses both go through validate_found_slot.
+    """
     try:
         # Check if OpenAI API key is set
         if not OPENAI_API_KEY:
             return None
             
-        # Prepare the API request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENAI_API_KEY}"
-        }
-        
-        # Get the current date and time for context
-        current_dt = datetime.now()
+        # Get the current date and time for context, in the user's timezone
+        current_dt = datetime.now(tz)
         today_str = current_dt.strftime("%A, %B %d, %Y")
         
         # Extract just the ISO dates from the formatted strings for validation later
@@ -458,6 +640,12 @@ def process_with_openai(command, available_slots):
                 iso_part = slot_str.split(" - ")[0].strip()
                 available_iso_slots.append(iso_part)
             
+        # Reuse an earlier parse of the same command against the same slots
+        cache_slots = [today_str] + available_iso_slots
+        parsed_result = command_cache.get(command, cache_slots)
+        if parsed_result is not None:
+            return validate_found_slot(parsed_result, available_iso_slots)
+        
         # Create a prompt for OpenAI
         prompt = f"""
         Today is {today_str}.
@@ -475,7 +663,7 @@ def process_with_openai(command, available_slots):
         2. Only recommend slots from the provided available slots list 
         3. Do not make up or suggest slots that are not in the list
         4. Make sure to use the ISO datetime string exactly as given in the list
-        5. For the found_slot, use the exact ISO string from the list, not the adjusted time
+        5. For the found_slot, use the exact ISO string from the list, not the human-readable time
         
         Respond with a valid JSON object in this exact format:
         {{
@@ -496,232 +684,123 @@ def process_with_openai(command, available_slots):
             "response_format": {"type": "json_object"}
         }
         
-        response = requests.post("https://api.openai.com/v1/chat/completions", 
-                               headers=headers, 
-                               json=payload)
+        # Deadline, retries and concurrency limits are handled by the client
+        with span("openai"):
+            response_data = await openai_client.chat_completion(payload)
         
-        if response.status_code == 200:
-            response_data = response.json()
+        if response_data:
             content = response_data['choices'][0]['message']['content']
             
             # Parse the JSON response from OpenAI
-            import json
             parsed_result = json.loads(content)
+            command_cache.set(command, cache_slots, parsed_result)
             
-            # Ensure the message is consistent with the found slot
-            if parsed_result.get("found_slot"):
-                try:
-                    # Validate that the found slot is one of our available slots
-                    found_slot = parsed_result["found_slot"]
-                    
-                    # If the slot has timezone info with 'Z', standardize it
-                    if found_slot.endswith('Z'):
-                        found_slot = found_slot[:-1] + '+00:00'
-                        
-                    # Check if the slot is in our available slots
-                    slot_found = False
-                    for avail_slot in available_iso_slots:
-                        if avail_slot.endswith('Z'):
-                            avail_slot = avail_slot[:-1] + '+00:00'
-                            
-                        if found_slot == avail_slot:
-                            slot_found = True
-                            # Ensure we use exactly the same format as in our available slots
-                            parsed_result["found_slot"] = avail_slot
-                            break
-                            
-                    if not slot_found:
-                        # If OpenAI returned an invalid slot, set to None
-                        parsed_result["found_slot"] = None
-                        parsed_result["message"] = "Could not find a matching available slot. Please select a date and time manually."
-                        return parsed_result
-                    
-                    # Format the date consistently for the message with timezone adjustment
-                    slot_dt = datetime.fromisoformat(parsed_result["found_slot"].replace('Z', '+00:00'))
-                    
-                    # Adjust the actual ISO datetime in found_slot by +2 hours
-                    adjusted_slot_dt = slot_dt + timedelta(hours=2)
-                    parsed_result["found_slot"] = adjusted_slot_dt.isoformat()
-                    
-                    # Adjust for timezone (+2 hours) for display message only
-                    friendly_date = adjusted_slot_dt.strftime("%A, %B %d at %I:%M %p")
-                    event_name = parsed_result.get("event_name", "Event")
-                    
-                    # Ensure message is consistent with the slot
-                    parsed_result["message"] = f"Found a slot for '{event_name}' on {friendly_date}. Click 'Schedule Event' to confirm."
-                except Exception:
-                    # If there's any error in validation, set to None
-                    parsed_result["found_slot"] = None
-                    parsed_result["message"] = "Could not validate the available slot. Please select a date and time manually."
-            
-            return parsed_result
+            return validate_found_slot(parsed_result, available_iso_slots)
         else:
             return None
             
     except Exception as e:
         return None
 
-def extract_event_info(command):
-    """Extract event name, date, time, and description from command"""
-    # Default values
-    event_name = None
-    event_date = None
-    event_time = None
-    description = None
-    
-    # Extract event name (simplistic approach - first part of the command)
-    name_match = re.search(r'schedule\s+(?:an?|the)\s+(.+?)(?:\s+on\s+|\s+at\s+|\s+for\s+|$)', command)
-    if name_match:
-        event_name = name_match.group(1).strip()
-    else:
-        # Fallback - take everything after "schedule"
-        name_match = re.search(r'schedule\s+(.+?)(?:\s+on\s+|\s+at\s+|\s+for\s+|$)', command)
-        if name_match:
-            event_name = name_match.group(1).strip()
-    
-    # Extract date
-    days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-    day_pattern = '|'.join(days)
-    
-    date_match = re.search(f'(?:on|this|next)\\s+({day_pattern})', command)
-    if date_match:
-        day_name = date_match.group(1).lower()
-        day_index = days.index(day_name)
-        
-        # Calculate date
-        today = datetime.now()
-        current_day_idx = today.weekday()  # 0 = Monday, 6 = Sunday
-        
-        if "next" in command:
-            # Next week's day
-            days_ahead = (day_index - current_day_idx) % 7 + 7
-        else:
-            # This week's day
-            days_ahead = (day_index - current_day_idx) % 7
+def validate_found_slot(parsed_result, available_iso_slots):
+    """Check a parsed command's found_slot against the available slots and fix up the message"""
+    # Ensure the message is consistent with the found slot
+    if parsed_result.get("found_slot"):
+        try:
+            # Validate that the found slot is one of our available slots
+            found_slot = parsed_result["found_slot"]
             
-            # If it's today or in the past, assume next week
-            if days_ahead == 0 and "today" not in command:
-                days_ahead = 7
+            # If the slot has timezone info with 'Z', standardize it
+            if found_slot.endswith('Z'):
+                found_slot = found_slot[:-1] + '+00:00'
                 
-        target_date = today + timedelta(days=days_ahead)
-        event_date = {
-            'year': target_date.year,
-            'month': target_date.month,
-            'day': target_date.day
-        }
-    
-    # Extract time
-    time_match = re.search(r'at\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?', command)
-    if time_match:
-        hour = int(time_match.group(1))
-        minute = int(time_match.group(2)) if time_match.group(2) else 0
-        am_pm = time_match.group(3)
-        
-        # Convert to 24-hour format
-        if am_pm:
-            if am_pm.lower() == 'pm' and hour < 12:
-                hour += 12
-            elif am_pm.lower() == 'am' and hour == 12:
-                hour = 0
-        elif hour < 8:  # Assume PM for ambiguous times (e.g., "at 5")
-            hour += 12
+            # Check if the slot is in our available slots
+            slot_found = False
+            for avail_slot in available_iso_slots:
+                if avail_slot.endswith('Z'):
+                    avail_slot = avail_slot[:-1] + '+00:00'
+                    
+                if found_slot == avail_slot:
+                    slot_found = True
+                    # Ensure we use exactly the same format as in our available slots
+                    parsed_result["found_slot"] = avail_slot
+                    break
+                    
+            if not slot_found:
+                # If OpenAI returned an invalid slot, set to None
+                parsed_result["found_slot"] = None
+                parsed_result["message"] = "Could not find a matching available slot. Please select a date and time manually."
+                return parsed_result
             
-        event_time = {'hour': hour, 'minute': minute}
-    
-    # Extract description (anything after "for" or "to")
-    desc_match = re.search(r'(?:for|to)\s+(.+?)$', command)
-    if desc_match:
-        description = desc_match.group(1).strip()
+            # Format the date consistently for the message; the ISO string already
+            # carries the user's UTC offset
+            slot_dt = datetime.fromisoformat(parsed_result["found_slot"].replace('Z', '+00:00'))
+            friendly_date = slot_dt.strftime("%A, %B %d at %I:%M %p")
+            event_name = parsed_result.get("event_name", "Event")
+            
+            # Ensure message is consistent with the slot
+            parsed_result["message"] = f"Found a slot for '{event_name}' on {friendly_date}. Click 'Schedule Event' to confirm."
+        except Exception:
+            # If there's any error in validation, set to None
+            parsed_result["found_slot"] = None
+            parsed_result["message"] = "Could not validate the available slot. Please select a date and time manually."
     
-    return event_name, event_date, event_time, description
+    return parsed_result
 
-def generate_available_slots(start_date, days_ahead, busy_periods):
-    """Generate available time slots based on busy periods"""
-    available_slots = []
-    
-    for day in range(days_ahead):
-        date = start_date + timedelta(days=day)
-        # Include all days including weekends
-        
-        # Generate slots for 9 AM to 7 PM with 30-min intervals for more flexibility
-        for hour in range(9, 19):  # End at 6:30 PM for 1-hour slots
-            for minute in [0, 30]:  # Add 30-minute intervals
-                slot_time = datetime(
-                    date.year, date.month, date.day, 
-                    hour, minute, tzinfo=timezone.utc
-                )
-                
-                # Skip slots in the past
-                if slot_time <= start_date:
-                    continue
-                
-                # Check if slot conflicts with busy periods
-                is_available = True
-                for busy in busy_periods:
-                    # Make sure both times have proper timezone information
-                    busy_start = busy['start'] 
-                    busy_end = busy['end']
-                    
-                    # Ensure we have timezone info - use UTC (Z) if none provided
-                    if 'Z' not in busy_start and '+' not in busy_start and '-' not in busy_start:
-                        busy_start = busy_start + 'Z'
-                    if 'Z' not in busy_end and '+' not in busy_end and '-' not in busy_end:
-                        busy_end = busy_end + 'Z'
-                        
-                    # Parse to datetime objects with timezone
-                    busy_start = datetime.fromisoformat(busy_start.replace('Z', '+00:00'))
-                    busy_end = datetime.fromisoformat(busy_end.replace('Z', '+00:00'))
-                    
-                    # 1-hour slots, so check if any part overlaps with busy period
-                    slot_end = slot_time + timedelta(hours=1)
-                    
-                    # If slot overlaps with busy period, mark as unavailable
-                    if (busy_start <= slot_time < busy_end) or \
-                       (busy_start < slot_end <= busy_end) or \
-                       (slot_time <= busy_start and slot_end >= busy_end):
-                        is_available = False
-                        break
-                
-                if is_available:
-                    available_slots.append(slot_time.isoformat())
+def generate_available_slots(start_date, days_ahead, busy_index, grid):
+    """Available Slots on the grid over days_ahead local days, starting after start_date"""
+    candidates = grid.iter_slots(grid.today(start_date), days_ahead, after=start_date.timestamp())
     
-    return available_slots
+    # Check all candidates against the merged busy periods in one pass
+    with span("slot_generation"):
+        return list(filter_available(candidates, busy_index))
 
-def find_matching_slots(available_slots, event_date, event_time):
-    """Find slots that match the requested date and time"""
-    if not available_slots:
+def find_matching_slots(slot_index, event_date, event_time):
+    """Find slots that match the requested date and time, closest to the requested time first"""
+    if not slot_index:
         return []
-        
-    matching_slots = []
-    
-    for slot in available_slots:
-        slot_dt = datetime.fromisoformat(slot.replace('Z', '+00:00'))
-        
-        # Check if date matches
-        date_matches = True
-        if event_date:
-            if (slot_dt.year != event_date['year'] or 
-                slot_dt.month != event_date['month'] or 
-                slot_dt.day != event_date['day']):
-                date_matches = False
-        
-        # Check if time matches (within 1 hour)
-        time_matches = True
-        if event_time and date_matches:
-            hour_diff = abs(slot_dt.hour - event_time['hour'])
-            
-            # Check if the time is within 2 hours of requested time
-            if hour_diff > 2:
-                time_matches = False
-                
-            # If minutes are specified, check them too (within 30 min)
-            if 'minute' in event_time and abs(slot_dt.minute - event_time['minute']) > 30:
-                time_matches = False
-        
-        if date_matches and time_matches:
-            matching_slots.append(slot)
     
-    return matching_slots
+    # Date is a dictionary hit, time (within 2 hours) a bisect inside that day
+    return slot_index.find(event_date, event_time)
+
+def find_exact_slot(matching_slots, event_time, tz=timezone.utc):
+    """The matching slot that starts exactly at the requested (local) time, if any"""
+    if not event_time or not matching_slots:
+        return None
+    # Matches are ordered by distance, so an exact match comes first
+    slot_dt = matching_slots[0].to_datetime(tz)
+    if slot_dt.hour == event_time['hour'] and slot_dt.minute == event_time['minute']:
+        return matching_slots[0]
+    return None
+
+@app.get("/stats")
+async def get_stats():
+    """Cache, coalescing and queue counters"""
+    return {
+        "calendar_services": calendar_services.stats(),
+        "freebusy_cache": freebusy_cache.stats(),
+        "command_cache": command_cache.stats(),
+        "schedule_coalescing": schedule_flights.stats(),
+        "calendar_breaker": calendar_breaker.stats(),
+        "availability_snapshots": availability_snapshots.stats(),
+        "credentials": credential_manager.stats(),
+        "event_queue": event_queue.stats()
+    }
+
+# Existing counters, exported as gauges on /metrics
+metrics_registry.register_collector("calendar_services", calendar_services.stats)
+metrics_registry.register_collector("freebusy_cache", freebusy_cache.stats)
+metrics_registry.register_collector("command_cache", command_cache.stats)
+metrics_registry.register_collector("schedule_coalescing", schedule_flights.stats)
+metrics_registry.register_collector("calendar_breaker", calendar_breaker.stats)
+metrics_registry.register_collector("availability_snapshots", availability_snapshots.stats)
+metrics_registry.register_collector("credentials", credential_manager.stats)
+metrics_registry.register_collector("event_queue", event_queue.stats)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Latency histograms and counters in the Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/session/clear")
 async def clear_session(request: Request):
@@ -0,0 +1,181 @@
+# metrics.py
+import os
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar, copy_context
+from functools import partial
+from starlette.datastructures import MutableHeaders
+
+# Latency histograms, spans and Server-Timing headers are only collected when enabled;
+# when off, span() hands back a shared no-op context manager
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_METRIC = "app_stage_duration_seconds"
+REQUEST_METRIC = "app_http_request_duration_seconds"
+
+# (stage name, seconds) pairs recorded during the current request, for Server-Timing
+_request_timings = ContextVar("request_timings", default=None)
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        """(cumulative bucket counts, sum, count)"""
+        with self._lock:
+            cumulative = []
+            running = 0
+            for count in self.counts:
+                running += count
+                cumulative.append(running)
+            return cumulative, self.total, self.count
+
+class MetricsRegistry:
+    """Labelled histograms plus collectors that expose existing stats() counters"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.collectors = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        histogram.observe(value)
+
+    def register_collector(self, prefix, collect):
+        """Export collect() (a possibly nested dict of numbers) as gauges named app_<prefix>_<key>"""
+        self.collectors[prefix] = collect
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        typed = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative, total, count = histogram.snapshot()
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            prefix = label_text + "," if label_text else ""
+            for bound, bucket_count in zip(histogram.buckets, cumulative):
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {bucket_count}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{label_text}}} {total}")
+            lines.append(f"{name}_count{{{label_text}}} {count}")
+
+        for prefix, collect in sorted(self.collectors.items()):
+            for key, value in _flatten(collect()):
+                name = f"app_{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def _flatten(stats, prefix=""):
+    """(name, number) pairs from a nested stats dict, skipping non-numeric values"""
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name + "_")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+registry = MetricsRegistry()
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        registry.observe(STAGE_METRIC, elapsed, stage=self.name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+_NOOP_SPAN = nullcontext()
+
+def span(name):
+    """Context manager timing one stage of a request (a no-op when metrics are disabled)"""
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return _Span(name)
+
+def bind_context(func):
+    """Carry the current request's span context into a worker thread"""
+    if not METRICS_ENABLED:
+        return func
+    return partial(copy_context().run, func)
+
+def server_timing_header(timings, total):
+    """Server-Timing value such as 'freebusy;dur=12.5, total;dur=40.1'"""
+    entries = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class MetricsMiddleware:
+    """Times every HTTP request, collects its spans and adds a Server-Timing header.
+
+    Only added to the app when METRICS_ENABLED is set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing_header(timings, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            # Route templates keep label cardinality bounded (no raw ids in paths)
+            route = scope.get("route")
+            registry.observe(
+                REQUEST_METRIC, time.perf_counter() - start,
+                method=scope["method"], route=getattr(route, "path", "unmatched"), status=str(status_code)
+            )
@@ -0,0 +1,93 @@
+# openaiClient.py
+import asyncio
+import os
+import random
+import httpx
+
+# Point at a local stub server (e.g. http://127.0.0.1:9000/v1) for testing
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+# Hard deadline in seconds for a completion, including every retry
+OPENAI_DEADLINE = float(os.getenv("OPENAI_DEADLINE", "20"))
+
+# Retries after the first attempt for timeouts, 429s and 5xx responses
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+# Completions allowed in flight at once across all requests
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class OpenAIError(Exception):
+    """Raised when a completion can't be obtained within the retry budget"""
+
+class OpenAIClient:
+    """Async chat completions client with a pooled connection, deadline and bounded retries"""
+
+    def __init__(self, api_key, base_url=OPENAI_BASE_URL, deadline=OPENAI_DEADLINE,
+                 max_retries=OPENAI_MAX_RETRIES, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                 backoff_base=0.5, backoff_cap=4.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+
+    def _get_client(self):
+        # Created on first use so the connection pool belongs to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                limits=httpx.Limits(max_keepalive_connections=self.max_concurrency, keepalive_expiry=60),
+                timeout=self.deadline
+            )
+        return self._client
+
+    async def chat_completion(self, payload):
+        """POST /chat/completions and return the decoded response body"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        client = self._get_client()
+        last_error = None
+
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                retry_after = 0
+                try:
+                    response = await asyncio.wait_for(client.post("/chat/completions", json=payload), remaining)
+                except (httpx.TransportError, asyncio.TimeoutError) as e:
+                    last_error = e
+                else:
+                    if response.status_code == 200:
+                        return response.json()
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        raise OpenAIError(f"OpenAI returned {response.status_code}: {response.text[:200]}")
+                    last_error = OpenAIError(f"OpenAI returned {response.status_code}")
+                    try:
+                        retry_after = float(response.headers.get("retry-after", 0))
+                    except ValueError:
+                        retry_after = 0
+
+                if attempt == self.max_retries:
+                    break
+                # Exponential backoff with full jitter, never past the deadline
+                delay = max(retry_after, random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+                if loop.time() + delay >= deadline:
+                    break
+                await asyncio.sleep(delay)
+
+        raise OpenAIError(f"OpenAI completion failed within {self.deadline}s: {last_error!r}")
+
+    async def aclose(self):
+        """Close the pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,66 +1,169 @@
 import os
-from datetime import datetime
+from datetime import datetime, timezone
+import numpy as np
 
-def rank_time_slots(available_slots, context_info):
-    """Rank time slots based on context info"""
-    if not available_slots:
-        return "No slots available for ranking."
-    
-    # Parse preferred times from context
-    prefers_morning = "morning" in context_info.lower()
-    prefers_afternoon = "afternoon" in context_info.lower()
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Longest slot range that may share one UTC offset when both ends agree; DST
+# changes are months apart, so a shorter range can't hold two of them
+MAX_SINGLE_OFFSET_SPAN = 90 * SECONDS_PER_DAY
+
+# Weekdays that can be named as a preference in the context text
+PREFERRED_WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+
+def parse_context_preferences(context_info):
+    """Read time-of-day and weekday preferences out of the context text"""
+    context = context_info.lower()
+    prefers_morning = "morning" in context
+    prefers_afternoon = "afternoon" in context
     
-    # Find preferred weekday if mentioned
-    weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+    # Find preferred weekday if mentioned (0 = Monday)
     preferred_day = None
-    for day in weekdays:
-        if day in context_info.lower():
-            preferred_day = day
+    for index, day in enumerate(PREFERRED_WEEKDAYS):
+        if day in context:
+            preferred_day = index
             break
     
-    # Score each available slot
-    scored_slots = []
-    for slot in available_slots:
-        try:
-            dt = datetime.fromisoformat(slot.replace('Z', '+00:00'))
-            score = 0
-            
-            # Weekday preference
-            if preferred_day and dt.strftime('%A').lower() == preferred_day:
-                score += 10
-            
-            # Time of day preference
-            hour = dt.hour
-            if prefers_morning and 9 <= hour <= 12:
-                score += 5
-            elif prefers_afternoon and 13 <= hour <= 17:
-                score += 5
-            
-            # Prefer times not too early or too late
-            if 10 <= hour <= 15:  # 10 AM to 3 PM is generally good
-                score += 3
-                
-            scored_slots.append((slot, score))
-            
-        except Exception:
-            # Skip slots with parsing issues
-            continue
+    return prefers_morning, prefers_afternoon, preferred_day
+
+def utc_offsets(slot_epochs, tz):
+    """UTC offsets in seconds that turn slot start times into local time for tz.
+
+    A single offset when it's the same at both ends of a short range (no DST
+    change in between), otherwise one per slot.
+    """
+    if not len(slot_epochs):
+        return 0
+    first, last = int(slot_epochs[0]), int(slot_epochs[-1])
+    first_offset = datetime.fromtimestamp(first, tz).utcoffset().total_seconds()
+    last_offset = datetime.fromtimestamp(last, tz).utcoffset().total_seconds()
+    if first_offset == last_offset and last - first < MAX_SINGLE_OFFSET_SPAN:
+        return int(first_offset)
+    return np.array(
+        [datetime.fromtimestamp(int(epoch), tz).utcoffset().total_seconds() for epoch in slot_epochs],
+        dtype=np.int64
+    )
+
+def score_slots(slot_epochs, context_info, offsets=0):
+    """Score slot start times (epoch seconds) in one vectorized pass.
+
+    offsets (from utc_offsets) makes weekdays and hours local rather than UTC.
+    """
+    prefers_morning, prefers_afternoon, preferred_day = parse_context_preferences(context_info)
     
-    # Sort by score (descending)
-    scored_slots.sort(key=lambda x: x[1], reverse=True)
+    epochs = np.asarray(slot_epochs, dtype=np.int64) + offsets
+    # 1970-01-01 was a Thursday, so shift by 3 to get Monday = 0
+    weekdays = (epochs // SECONDS_PER_DAY + 3) % 7
+    hours = (epochs % SECONDS_PER_DAY) // 3600
+    scores = np.zeros(len(epochs), dtype=np.int64)
     
-    # Format the top 3 or fewer recommendations
-    top_slots = scored_slots[:min(3, len(scored_slots))]
+    # Weekday preference
+    if preferred_day is not None:
+        scores += 10 * (weekdays == preferred_day)
+    
+    # Time of day preference
+    # Both can apply when the context mentions mornings and afternoons
+    morning = (hours >= 9) & (hours <= 12)
+    afternoon = (hours >= 13) & (hours <= 17)
+    scores += 5 * ((prefers_morning & morning) | (prefers_afternoon & afternoon))
+    
+    # Prefer times not too early or too late (10 AM to 3 PM is generally good)
+    scores += 3 * ((hours >= 10) & (hours <= 15))
+    
+    return scores, weekdays, hours
+
+def rank_slot_epochs(slot_epochs, context_info, k=3, tz=timezone.utc):
+    """Rank slot start times (epoch seconds) and return the top k as structured results.
+
+    Weekdays, hours and start times are in local time for tz. Uses partial
+    selection instead of sorting every slot; ties keep the input order.
+    """
+    scores, weekdays, hours = score_slots(slot_epochs, context_info, utc_offsets(slot_epochs, tz))
+    k = min(k, len(scores))
+    if k == 0:
+        return []
     
-    if not top_slots:
+    top = np.argpartition(-scores, k - 1)[:k]
+    # Order the top k by score (descending), then by position in the input
+    top = top[np.lexsort((top, -scores[top]))]
+    
+    epochs = np.asarray(slot_epochs, dtype=np.int64)
+    return [
+        {
+            "start": datetime.fromtimestamp(int(epochs[i]), tz).isoformat(),
+            "score": int(scores[i]),
+            "weekday": int(weekdays[i]),
+            "hour": int(hours[i])
+        }
+        for i in top
+    ]
+
+def format_ranked_slots(ranked_slots):
+    """Recommendation text for rank_slot_epochs results"""
+    if not ranked_slots:
         return "No suitable slots found based on your preferences."
     
     # Build the recommendation text
     result = "Based on your scheduling patterns, here are the recommended slots:\n\n"
     
-    for i, (slot, score) in enumerate(top_slots, 1):
-        dt = datetime.fromisoformat(slot.replace('Z', '+00:00'))
+    for i, slot in enumerate(ranked_slots, 1):
+        dt = datetime.fromisoformat(slot["start"])
         formatted_time = dt.strftime("%A, %B %d at %I:%M %p")
         result += f"{i}. {formatted_time}\n"
     
     return result
+
+def rank_time_slots(available_slots, context_info, tz=timezone.utc):
+    """Rank Slots based on context info in local time for tz.
+
+    Returns (recommendation text, structured top slots from rank_slot_epochs).
+    """
+    if not available_slots:
+        return "No available slots found in the specified time range.", []
+    
+    # Slots already carry their start as epoch seconds
+    slot_epochs = [slot.start for slot in available_slots]
+    
+    # Format the top 3 or fewer recommendations
+    ranked_slots = rank_slot_epochs(slot_epochs, context_info, tz=tz)
+    return format_ranked_slots(ranked_slots), ranked_slots
+
+def analyze_event_patterns(calendar_events):
+    """Extract patterns from calendar events to provide context for recommendations.
+
+    calendar_events can be any iterable (e.g. a paginated generator); it is
+    consumed once. Returns (event_count, patterns_text).
+    """
+    # Count events by day of week
+    weekday_counts = [0] * 7  # Monday to Sunday
+    hour_counts = [0] * 24  # 0-23 hours
+    event_count = 0
+    
+    for event in calendar_events:
+        event_count += 1
+        try:
+            start = event.get('start', {})
+            if 'dateTime' in start:
+                start_time = datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
+                weekday = start_time.weekday()
+                hour = start_time.hour
+                
+                weekday_counts[weekday] += 1
+                hour_counts[hour] += 1
+        except (ValueError, KeyError):
+            continue
+    
+    if not event_count:
+        return 0, "No existing events found to analyze patterns."
+    
+    # Find preferred days and times
+    max_weekday = weekday_counts.index(max(weekday_counts))
+    weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    preferred_day = weekdays[max_weekday]
+    
+    # Check if mornings or afternoons are preferred
+    morning_count = sum(hour_counts[9:12])  # 9 AM to 12 PM
+    afternoon_count = sum(hour_counts[13:17])  # 1 PM to 5 PM
+    time_preference = "mornings" if morning_count > afternoon_count else "afternoons"
+    
+    return event_count, f"User typically schedules meetings on {preferred_day} and prefers {time_preference}."
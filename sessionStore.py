@@ -0,0 +1,234 @@
+# sessionStore.py
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+# "memory" or "sqlite"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+
+# SQLite file used by the sqlite backend
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./sessions.sqlite3")
+
+# Seconds a session lives after its last change (14 days, like the signed-cookie sessions)
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(14 * 24 * 60 * 60)))
+
+# Sessions kept by the memory backend before the least recently used ones are evicted
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+
+# Signs session ids so a forged id is rejected before any store lookup
+SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY", "your-secret-key-here")  # Use a strong secret in production
+
+SESSION_COOKIE_NAME = os.getenv("SESSION_COOKIE_NAME", "session_id")
+
+# Seconds after which a session in use is saved again, sliding its expiry and reissuing the cookie
+SESSION_RENEW_INTERVAL = int(os.getenv("SESSION_RENEW_INTERVAL", str(24 * 60 * 60)))
+
+def _marks_modified(method):
+    def wrapper(self, *args, **kwargs):
+        self.modified = True
+        return method(self, *args, **kwargs)
+    return wrapper
+
+class Session(dict):
+    """Session data that remembers whether it was changed during the request"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.modified = False
+        self.regenerate_id = False
+
+    def regenerate(self):
+        """Move this data to a new session id when the response is sent (e.g. after login)"""
+        self.regenerate_id = True
+        self.modified = True
+
+    __setitem__ = _marks_modified(dict.__setitem__)
+    __delitem__ = _marks_modified(dict.__delitem__)
+    clear = _marks_modified(dict.clear)
+    pop = _marks_modified(dict.pop)
+    popitem = _marks_modified(dict.popitem)
+    setdefault = _marks_modified(dict.setdefault)
+    update = _marks_modified(dict.update)
+
+class MemorySessionBackend:
+    """In-process LRU of session dicts with TTL"""
+
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at <= time.time():
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return dict(data), expires_at
+
+    def set(self, session_id, data):
+        with self._lock:
+            self._entries[session_id] = (time.time() + self.ttl, dict(data))
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+class SqliteSessionBackend:
+    """Session dicts persisted as JSON in a local SQLite file, shared across restarts and workers"""
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, expires_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                return None
+            return json.loads(row[0]), row[1]
+
+    def set(self, session_id, data):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), now + self.ttl)
+            )
+            self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+class SessionStore:
+    """Server-side session data on top of a memory or SQLite backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def load(self, session_id):
+        entry = self.backend.get(session_id)
+        return entry[0] if entry else None
+
+    def load_entry(self, session_id):
+        """(data, expires_at) for a live session, or None"""
+        return self.backend.get(session_id)
+
+    def save(self, session_id, data):
+        self.backend.set(session_id, data)
+
+    def delete(self, session_id):
+        self.backend.delete(session_id)
+
+def create_session_store():
+    """SessionStore using the backend selected by SESSION_BACKEND"""
+    if SESSION_BACKEND == "sqlite":
+        return SessionStore(SqliteSessionBackend())
+    return SessionStore(MemorySessionBackend())
+
+def sign_session_id(session_id, secret_key):
+    digest = hmac.new(secret_key.encode(), session_id.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+class ServerSessionMiddleware:
+    """Drop-in for SessionMiddleware that keeps session data in a SessionStore.
+
+    Only an HMAC-signed session id travels in the cookie; request.session works
+    as before and is written back to the store when it changed, or once every
+    renew_interval while it's in use. The cookie is reissued with every save so
+    both expire together.
+    """
+
+    def __init__(self, app, store, secret_key=SESSION_SECRET_KEY, session_cookie=SESSION_COOKIE_NAME,
+                 max_age=SESSION_TTL, renew_interval=SESSION_RENEW_INTERVAL, path="/", same_site="lax",
+                 https_only=False):
+        self.app = app
+        self.store = store
+        self.secret_key = secret_key
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.renew_interval = renew_interval
+        self.security_flags = f"path={path}; httponly; samesite={same_site}"
+        if https_only:
+            self.security_flags += "; secure"
+
+    def _session_id_from_cookie(self, connection):
+        value = connection.cookies.get(self.session_cookie)
+        if not value or "." not in value:
+            return None
+        session_id, signature = value.rsplit(".", 1)
+        if not hmac.compare_digest(signature, sign_session_id(session_id, self.secret_key)):
+            return None
+        return session_id
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        session_id = self._session_id_from_cookie(connection)
+        entry = self.store.load_entry(session_id) if session_id else None
+        if entry is None:
+            session_id = None
+        scope["session"] = session = Session(entry[0] if entry else {})
+        scope["session_id"] = session_id
+        # Saved more than renew_interval ago: save again so an active user isn't logged out
+        renew = entry is not None and entry[1] - time.time() < self.max_age - self.renew_interval
+
+        async def send_wrapper(message):
+            nonlocal session_id
+            if message["type"] == "http.response.start" and (session.modified or renew):
+                headers = MutableHeaders(scope=message)
+                if session:
+                    if session.regenerate_id and session_id is not None:
+                        # A new id after login, so an id planted before it (session fixation) is useless
+                        self.store.delete(session_id)
+                        session_id = None
+                    if session_id is None:
+                        session_id = scope["session_id"] = secrets.token_urlsafe(32)
+                    self.store.save(session_id, session)
+                    cookie = f"{session_id}.{sign_session_id(session_id, self.secret_key)}"
+                    headers.append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}={cookie}; Max-Age={self.max_age}; {self.security_flags}"
+                    )
+                elif session_id is not None:
+                    # An emptied session is removed along with its cookie
+                    self.store.delete(session_id)
+                    headers.append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}=null; Max-Age=0; {self.security_flags}"
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,33 @@
+# singleflight.py
+import asyncio
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers for a key share its result"""
+
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args):
+        """Await func(*args), or join the identical call already in flight for key"""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            future = self._in_flight[key] = asyncio.ensure_future(func(*args))
+            future.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so one caller giving up doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    def stats(self):
+        """Calls started and callers that joined one already in flight"""
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
@@ -0,0 +1,171 @@
+# slots.py
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, NamedTuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# IANA timezone used for working hours and display when a request names none
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+
+# Default meeting length and spacing between candidate start times, in minutes
+SLOT_DURATION_MINUTES = int(os.getenv("SLOT_DURATION_MINUTES", "60"))
+SLOT_STEP_MINUTES = int(os.getenv("SLOT_STEP_MINUTES", "30"))
+
+# Default working hours (local time); every slot must fit inside them
+WORKDAY_START_HOUR = int(os.getenv("WORKDAY_START_HOUR", "9"))
+WORKDAY_END_HOUR = int(os.getenv("WORKDAY_END_HOUR", "19"))
+
+class Slot:
+    """A candidate time slot: start in epoch seconds plus a duration in seconds.
+
+    Slots stay in this form internally and are only turned into local
+    datetimes or ISO strings when they are displayed or written into a response.
+    """
+    __slots__ = ('start', 'duration')
+
+    def __init__(self, start, duration):
+        self.start = int(start)
+        self.duration = int(duration)
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    def to_datetime(self, tz=timezone.utc):
+        return datetime.fromtimestamp(self.start, tz)
+
+    def isoformat(self, tz=timezone.utc):
+        return self.to_datetime(tz).isoformat()
+
+    def __eq__(self, other):
+        if not isinstance(other, Slot):
+            return NotImplemented
+        return self.start == other.start and self.duration == other.duration
+
+    def __lt__(self, other):
+        return (self.start, self.duration) < (other.start, other.duration)
+
+    def __hash__(self):
+        return hash((self.start, self.duration))
+
+    def __repr__(self):
+        return f"Slot({self.isoformat()}, {self.duration}s)"
+
+def resolve_timezone(name=None):
+    """ZoneInfo for an IANA name (DEFAULT_TIMEZONE if None); ValueError if unknown"""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+class SlotGrid:
+    """Candidate slot layout: duration, step between starts, working hours and timezone"""
+
+    def __init__(self, duration_minutes=SLOT_DURATION_MINUTES, step_minutes=SLOT_STEP_MINUTES,
+                 workday_start=WORKDAY_START_HOUR, workday_end=WORKDAY_END_HOUR, tz=None):
+        if duration_minutes <= 0 or step_minutes <= 0:
+            raise ValueError("Slot duration and step must be positive")
+        if not 0 <= workday_start < workday_end <= 24:
+            raise ValueError("Working hours must satisfy 0 <= start < end <= 24")
+        self.duration = duration_minutes * 60
+        self.step = step_minutes * 60
+        self.workday_start = workday_start
+        self.workday_end = workday_end
+        self.tz = resolve_timezone(tz) if tz is None or isinstance(tz, str) else tz
+
+    def key(self):
+        """Hashable description of the grid, for cache and coalescing keys"""
+        return (self.duration, self.step, self.workday_start, self.workday_end, self.tz.key)
+
+    def day_start(self, day):
+        """Aware datetime of local midnight starting day"""
+        return datetime.combine(day, time(0), self.tz)
+
+    def today(self, now):
+        """The local date at the aware datetime now"""
+        return now.astimezone(self.tz).date()
+
+    def iter_slots(self, first_day, days, after=None):
+        """Lazily yield Slots on days local dates from first_day, in time order.
+
+        Each day's working hours are resolved in the grid's timezone, so DST
+        changes move the UTC times rather than the local ones. Slots starting at
+        or before the epoch `after` are skipped.
+        """
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            open_at = int(datetime.combine(day, time(self.workday_start), self.tz).timestamp())
+            if self.workday_end == 24:
+                close_at = int(self.day_start(day + timedelta(days=1)).timestamp())
+            else:
+                close_at = int(datetime.combine(day, time(self.workday_end), self.tz).timestamp())
+            start = open_at
+            if after is not None and start <= after:
+                # Jump to the first step after `after` instead of walking the past
+                start += (int(after - start) // self.step + 1) * self.step
+            while start + self.duration <= close_at:
+                yield Slot(start, self.duration)
+                start += self.step
+
+class SlotBucket(NamedTuple):
+    """One day's slots as parallel lists sorted by minute of day"""
+    minutes: List[int]
+    slots: List[Slot]
+
+class SlotIndex:
+    """Available slots bucketed by local date for dictionary + bisect lookups"""
+
+    def __init__(self, available_slots, tz=timezone.utc):
+        self.buckets = {}
+        for slot in available_slots:
+            local_dt = slot.to_datetime(tz)
+            day, minute = local_dt.date(), local_dt.hour * 60 + local_dt.minute
+            bucket = self.buckets.get(day)
+            if bucket is None:
+                bucket = self.buckets[day] = SlotBucket([], [])
+            # Slots usually arrive sorted, so this is normally an append
+            if bucket.minutes and minute < bucket.minutes[-1]:
+                position = bisect_right(bucket.minutes, minute)
+                bucket.minutes.insert(position, minute)
+                bucket.slots.insert(position, slot)
+            else:
+                bucket.minutes.append(minute)
+                bucket.slots.append(slot)
+
+    def __len__(self):
+        return sum(len(bucket.slots) for bucket in self.buckets.values())
+
+    def _days(self, event_date):
+        if event_date is None:
+            return sorted(self.buckets)
+        day = date(event_date['year'], event_date['month'], event_date['day'])
+        return [day] if day in self.buckets else []
+
+    def find(self, event_date=None, event_time=None, hour_window=2, minute_window=30):
+        """Slots on event_date (any day if None) near event_time, closest first.
+
+        A slot matches when its hour is within hour_window of the requested hour
+        and its minute within minute_window of the requested minute. Without a
+        time, the day's slots are returned in time order.
+        """
+        matches = []
+        for day in self._days(event_date):
+            bucket = self.buckets[day]
+            if not event_time:
+                matches.extend(bucket.slots)
+                continue
+
+            requested = event_time['hour'] * 60 + event_time.get('minute', 0)
+            lo = bisect_left(bucket.minutes, (event_time['hour'] - hour_window) * 60)
+            hi = bisect_left(bucket.minutes, (event_time['hour'] + hour_window + 1) * 60)
+            for i in range(lo, hi):
+                minute = bucket.minutes[i]
+                if abs(minute % 60 - event_time.get('minute', 0)) <= minute_window:
+                    matches.append((abs(minute - requested), day, bucket.slots[i]))
+
+        if not event_time:
+            return matches
+        # Closest to the requested time first, earlier days breaking ties
+        matches.sort(key=lambda match: (match[0], match[1]))
+        return [slot for _, _, slot in matches]